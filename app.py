@@ -1,9 +1,15 @@
 from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session
 import sqlite3
 import os
+import time
 from datetime import datetime
 import pytz
-from scraper import scrape_rfd_forum, send_email, format_deals_email
+from scraper import scrape_rfd_forum
+from dedup import cluster_deals
+from search import index_deals, parse_search_args, search_deals
+from trend import observe_scrape, top_rising
+from digest import ensure_subscriber_columns, send_personalised_digests
+from unsubscribe import UnsubscribeBatcher, make_token, verify_token
 from dotenv import load_dotenv
 from functools import wraps
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -24,6 +30,8 @@ DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subscribers.
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
 
+unsubscribe_batcher = UnsubscribeBatcher(DB_PATH)
+
 # Database setup
 def init_db():
     conn = sqlite3.connect(DB_PATH)
@@ -33,13 +41,22 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
             subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1
+            is_active BOOLEAN DEFAULT 1,
+            num_deals INTEGER,
+            categories TEXT,
+            reactivated_at REAL
         )
     ''')
     conn.commit()
+    ensure_subscriber_columns(conn)
     conn.close()
 
 def add_subscriber(email):
+    # An unsubscribe still queued here, or in another worker's batcher, must
+    # not land after this subscribe: drop the local one, and stamp
+    # reactivated_at so any other is skipped when it is flushed
+    unsubscribe_batcher.discard(email)
+    now = time.time()
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
@@ -52,17 +69,19 @@ def add_subscriber(email):
             # Email exists, check if it's inactive
             if result[0] == 0:
                 # Reactivate the subscriber
-                cursor.execute('UPDATE subscribers SET is_active = 1 WHERE email = ?', (email,))
+                cursor.execute('UPDATE subscribers SET is_active = 1, reactivated_at = ? WHERE email = ?', (now, email))
                 conn.commit()
                 conn.close()
                 return True, "reactivated"
             else:
-                # Already active
+                # Already active, though an unsubscribe may be queued
+                cursor.execute('UPDATE subscribers SET reactivated_at = ? WHERE email = ?', (now, email))
+                conn.commit()
                 conn.close()
                 return False, "already_active"
         else:
             # New email, insert it
-            cursor.execute('INSERT INTO subscribers (email) VALUES (?)', (email,))
+            cursor.execute('INSERT INTO subscribers (email, reactivated_at) VALUES (?, ?)', (email, now))
             conn.commit()
             conn.close()
             return True, "new"
@@ -87,11 +106,8 @@ def get_inactive_subscribers():
     return subscribers
 
 def remove_subscriber(email):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE subscribers SET is_active = 0 WHERE email = ?', (email,))
-    conn.commit()
-    conn.close()
+    # Applied with other pending unsubscribes in one batched UPDATE
+    unsubscribe_batcher.add(email)
 
 
 def login_required(view_func):
@@ -140,6 +156,30 @@ def unsubscribe():
     
     return redirect(url_for('index'))
 
+@app.route('/u/<token>', methods=['GET', 'POST'])
+def unsubscribe_link(token):
+    email = verify_token(token)
+    if not email:
+        return render_template('unsubscribe.html', state='invalid'), 400
+
+    # GET only confirms, so link scanners can't unsubscribe anyone. Mail
+    # clients doing RFC 8058 one-click unsubscribe POST here directly.
+    if request.method == 'GET':
+        return render_template('unsubscribe.html', state='confirm', email=email, token=token)
+
+    remove_subscriber(email)
+    return render_template('unsubscribe.html', state='done', email=email,
+                           resubscribe_token=make_token(email, 'subscribe'))
+
+@app.route('/s/<token>', methods=['POST'])
+def resubscribe_link(token):
+    email = verify_token(token, 'subscribe')
+    if not email:
+        return render_template('unsubscribe.html', state='invalid'), 400
+    add_subscriber(email)
+    flash('Welcome back! Your subscription has been reactivated.', 'success')
+    return redirect(url_for('index'))
+
 @app.route('/reactivate', methods=['POST'])
 def reactivate():
     email = request.form.get('email')
@@ -159,22 +199,22 @@ def send_test():
     try:
         # Scrape current deals
         deals = scrape_rfd_forum()
+        index_deals(deals)
+        trends = observe_scrape(deals)
+        deals = trends.annotate(cluster_deals(deals))
         
         if deals:
-            # Get all subscribers
-            subscribers = get_all_subscribers()
+            # Render one digest per preference group and send to all subscribers
+            sent = send_personalised_digests(
+                deals,
+                "Today's Top Deals - Test",
+                EMAIL_SENDER,
+                EMAIL_PASSWORD,
+                DB_PATH
+            )
             
-            if subscribers:
-                # Send email to all subscribers
-                email_body = format_deals_email(deals)
-                send_email(
-                    "Today's Top Deals - Test",
-                    email_body,
-                    EMAIL_SENDER,
-                    subscribers,
-                    EMAIL_PASSWORD
-                )
-                flash(f'Test email sent to {len(subscribers)} subscribers!', 'success')
+            if sent:
+                flash(f'Test email sent to {sent} subscribers!', 'success')
             else:
                 flash('No subscribers found.', 'error')
         else:
@@ -186,6 +226,36 @@ def send_test():
     return redirect(url_for('admin'))
 
 
+@app.route('/search')
+def search():
+    results, next_cursor, error = [], None, None
+    try:
+        params = parse_search_args(request.args)
+    except ValueError:
+        params, error = None, 'Dates must be in YYYY-MM-DD format.'
+    if params and params['query']:
+        try:
+            results, next_cursor = search_deals(**params)
+        except (ValueError, TypeError):
+            # Only a malformed cursor gets past parse_search_args
+            error = 'Invalid page link. Please start the search again.'
+    return render_template('search.html', results=results, next_cursor=next_cursor, error=error, args=request.args)
+
+@app.route('/api/search')
+def api_search():
+    try:
+        params = parse_search_args(request.args)
+        results, next_cursor = search_deals(**params)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid date or cursor'}), 400
+    return jsonify({'results': results, 'next_cursor': next_cursor})
+
+@app.route('/api/trending')
+def api_trending():
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'results': top_rising(max(1, min(limit, 100)))})
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     next_url = request.args.get('next') or url_for('admin')
@@ -222,18 +292,19 @@ def send_deals_email():
         now_eastern = datetime.now(eastern_tz)
         
         deals = scrape_rfd_forum()
+        index_deals(deals)
+        trends = observe_scrape(deals)
+        deals = trends.annotate(cluster_deals(deals))
         if deals:
-            subscribers = get_all_subscribers()
-            if subscribers:
-                email_body = format_deals_email(deals)
-                send_email(
-                    "Today's Top Deals",
-                    email_body,
-                    EMAIL_SENDER,
-                    subscribers,
-                    EMAIL_PASSWORD
-                )
-                print(f"Daily email sent to {len(subscribers)} subscribers at {now_eastern.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            sent = send_personalised_digests(
+                deals,
+                "Today's Top Deals",
+                EMAIL_SENDER,
+                EMAIL_PASSWORD,
+                DB_PATH
+            )
+            if sent:
+                print(f"Daily email sent to {sent} subscribers at {now_eastern.strftime('%Y-%m-%d %H:%M:%S %Z')}")
             else:
                 print("No subscribers found for daily email")
         else:
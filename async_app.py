@@ -0,0 +1,339 @@
+"""
+Async (ASGI) serving mode for the RFD Daily Deals web app.
+
+This is a port of the routes in app.py to Quart, which keeps the Flask API
+and the same Jinja templates. Subscriber operations go through one
+long-lived aiosqlite connection, opened when the server starts, so they
+never block the event loop or pay for a new connection thread per query,
+and the scrape-plus-send job behind /send-test runs in a small thread pool
+as a background task so a slow upstream never holds a request open.
+
+Run with:
+    hypercorn async_app:app --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
+
+import aiosqlite
+import pytz
+from dotenv import load_dotenv
+from quart import Quart, render_template, request, flash, redirect, url_for, session
+
+from scraper import scrape_rfd_forum
+from dedup import cluster_deals
+from search import index_deals, parse_search_args, search_deals
+from trend import observe_scrape, top_rising
+from digest import ensure_subscriber_columns, send_personalised_digests
+from unsubscribe import UnsubscribeBatcher, make_token, verify_token
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, '.env'))
+
+app = Quart(__name__)
+app.config['SECRET_KEY'] = (
+    os.getenv('FLASK_SECRET_KEY')
+)
+
+
+EMAIL_SENDER = os.getenv('EMAIL_SENDER')
+EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
+DB_PATH = os.path.join(BASE_DIR, 'subscribers.db')
+ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
+ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+
+unsubscribe_batcher = UnsubscribeBatcher(DB_PATH)
+
+# Scrapes and SMTP sends are blocking; keep them off the event loop and cap
+# how many can run at once so repeated clicks can't pile up work.
+SCRAPE_WORKERS = int(os.getenv('SCRAPE_WORKERS', 2))
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix='scrape')
+
+# Opened in startup() and shared by every request in this worker
+db = None
+# Keeps each check-then-write on the shared connection in one piece
+db_write_lock = asyncio.Lock()
+
+# Database setup
+async def init_db():
+    global db
+    db = await aiosqlite.connect(DB_PATH)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS subscribers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            num_deals INTEGER,
+            categories TEXT,
+            reactivated_at REAL
+        )
+    ''')
+    await db.commit()
+    # One-off schema migration, cheap enough to run synchronously at startup
+    conn = sqlite3.connect(DB_PATH)
+    ensure_subscriber_columns(conn)
+    conn.close()
+
+async def add_subscriber(email):
+    # An unsubscribe still queued here, or in another worker's batcher, must
+    # not land after this subscribe: drop the local one, and stamp
+    # reactivated_at so any other is skipped when it is flushed
+    unsubscribe_batcher.discard(email)
+    now = time.time()
+    try:
+        async with db_write_lock:
+            # First check if the email already exists
+            async with db.execute('SELECT is_active FROM subscribers WHERE email = ?', (email,)) as cursor:
+                result = await cursor.fetchone()
+
+            if result:
+                # Email exists, check if it's inactive
+                if result[0] == 0:
+                    # Reactivate the subscriber
+                    await db.execute('UPDATE subscribers SET is_active = 1, reactivated_at = ? WHERE email = ?',
+                                     (now, email))
+                    await db.commit()
+                    return True, "reactivated"
+                else:
+                    # Already active, though an unsubscribe may be queued
+                    await db.execute('UPDATE subscribers SET reactivated_at = ? WHERE email = ?', (now, email))
+                    await db.commit()
+                    return False, "already_active"
+            else:
+                # New email, insert it
+                await db.execute('INSERT INTO subscribers (email, reactivated_at) VALUES (?, ?)', (email, now))
+                await db.commit()
+                return True, "new"
+
+    except aiosqlite.IntegrityError:
+        # Don't leave a failed write open on the shared connection
+        await db.rollback()
+        return False, "error"
+
+async def get_all_subscribers():
+    async with db.execute('SELECT email FROM subscribers WHERE is_active = 1') as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+async def get_inactive_subscribers():
+    async with db.execute('SELECT email FROM subscribers WHERE is_active = 0') as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+async def remove_subscriber(email):
+    # Applied with other pending unsubscribes in one batched UPDATE; the
+    # flush runs on the batcher's timer thread, never on the event loop
+    unsubscribe_batcher.add(email)
+
+
+def login_required(view_func):
+    @wraps(view_func)
+    async def wrapped_view(*args, **kwargs):
+        if not session.get('logged_in'):
+            next_url = request.path
+            return redirect(url_for('login', next=next_url))
+        return await view_func(*args, **kwargs)
+    return wrapped_view
+
+@app.before_serving
+async def startup():
+    await init_db()
+
+@app.after_serving
+async def shutdown():
+    scrape_executor.shutdown(wait=False, cancel_futures=True)
+    await asyncio.to_thread(unsubscribe_batcher.flush)
+    await db.close()
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/subscribe', methods=['POST'])
+async def subscribe():
+    form = await request.form
+    email = form.get('email')
+
+    if not email or '@' not in email:
+        await flash('Please enter a valid email address.', 'error')
+        return redirect(url_for('index'))
+
+    success, status = await add_subscriber(email)
+
+    if success:
+        if status == "new":
+            await flash('Successfully subscribed! You\'ll receive daily deals starting tomorrow.', 'success')
+        elif status == "reactivated":
+            await flash('Welcome back! Your subscription has been reactivated.', 'success')
+    else:
+        if status == "already_active":
+            await flash('This email is already subscribed.', 'info')
+        else:
+            await flash('An error occurred. Please try again.', 'error')
+
+    return redirect(url_for('index'))
+
+@app.route('/unsubscribe', methods=['POST'])
+async def unsubscribe():
+    form = await request.form
+    email = form.get('email')
+
+    if email:
+        await remove_subscriber(email)
+        await flash('Successfully unsubscribed. You won\'t receive any more emails.', 'success')
+
+    return redirect(url_for('index'))
+
+@app.route('/u/<token>', methods=['GET', 'POST'])
+async def unsubscribe_link(token):
+    email = verify_token(token)
+    if not email:
+        return await render_template('unsubscribe.html', state='invalid'), 400
+
+    # GET only confirms, so link scanners can't unsubscribe anyone. Mail
+    # clients doing RFC 8058 one-click unsubscribe POST here directly.
+    if request.method == 'GET':
+        return await render_template('unsubscribe.html', state='confirm', email=email, token=token)
+
+    await remove_subscriber(email)
+    return await render_template('unsubscribe.html', state='done', email=email,
+                                 resubscribe_token=make_token(email, 'subscribe'))
+
+@app.route('/s/<token>', methods=['POST'])
+async def resubscribe_link(token):
+    email = verify_token(token, 'subscribe')
+    if not email:
+        return await render_template('unsubscribe.html', state='invalid'), 400
+    await add_subscriber(email)
+    await flash('Welcome back! Your subscription has been reactivated.', 'success')
+    return redirect(url_for('index'))
+
+@app.route('/reactivate', methods=['POST'])
+async def reactivate():
+    form = await request.form
+    email = form.get('email')
+    await add_subscriber(email)
+    return redirect(url_for('admin'))
+
+@app.route('/admin')
+@login_required
+async def admin():
+    subscribers, inactive_subscribers = await asyncio.gather(
+        get_all_subscribers(),
+        get_inactive_subscribers(),
+    )
+    return await render_template('admin.html', subscribers=subscribers, inactive_subscribers=inactive_subscribers, count=len(subscribers))
+
+def scrape_and_send(subject):
+    """Blocking scrape + render + SMTP send, run on the scrape executor"""
+    deals = scrape_rfd_forum()
+    index_deals(deals)
+    trends = observe_scrape(deals)
+    deals = trends.annotate(cluster_deals(deals))
+    if not deals:
+        print("No deals found to send")
+        return
+    sent = send_personalised_digests(deals, subject, EMAIL_SENDER, EMAIL_PASSWORD, DB_PATH)
+    print(f"Email sent to {sent} subscribers")
+
+async def run_in_scrape_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(scrape_executor, func, *args)
+    except Exception as e:
+        print(f"Error in background send: {e}")
+
+@app.route('/send-test', methods=['POST'])
+@login_required
+async def send_test():
+    subscribers = await get_all_subscribers()
+
+    if subscribers:
+        # Don't hold the request open for the scrape and SMTP round trips
+        app.add_background_task(run_in_scrape_executor, scrape_and_send, "Today's Top Deals - Test")
+        await flash(f'Test email queued for {len(subscribers)} subscribers.', 'success')
+    else:
+        await flash('No subscribers found.', 'error')
+
+    return redirect(url_for('admin'))
+
+
+@app.route('/search')
+async def search():
+    results, next_cursor, error = [], None, None
+    try:
+        params = parse_search_args(request.args)
+    except ValueError:
+        params, error = None, 'Dates must be in YYYY-MM-DD format.'
+    if params and params['query']:
+        try:
+            results, next_cursor = await asyncio.to_thread(search_deals, **params)
+        except (ValueError, TypeError):
+            # Only a malformed cursor gets past parse_search_args
+            error = 'Invalid page link. Please start the search again.'
+    return await render_template('search.html', results=results, next_cursor=next_cursor, error=error, args=request.args)
+
+@app.route('/api/search')
+async def api_search():
+    try:
+        params = parse_search_args(request.args)
+        results, next_cursor = await asyncio.to_thread(search_deals, **params)
+    except (ValueError, TypeError):
+        return {'error': 'Invalid date or cursor'}, 400
+    return {'results': results, 'next_cursor': next_cursor}
+
+@app.route('/api/trending')
+async def api_trending():
+    limit = request.args.get('limit', 20, type=int)
+    return {'results': await asyncio.to_thread(top_rising, max(1, min(limit, 100)))}
+
+
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    next_url = request.args.get('next') or url_for('admin')
+    if request.method == 'POST':
+        form = await request.form
+        username = form.get('username', '')
+        password = form.get('password', '')
+        next_post = form.get('next') or url_for('admin')
+
+        if not ADMIN_USERNAME or not ADMIN_PASSWORD:
+            await flash('Admin credentials are not configured on the server.', 'error')
+            return redirect(url_for('login', next=next_post))
+
+        if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
+            session['logged_in'] = True
+            await flash('Logged in successfully.', 'success')
+            return redirect(next_post)
+        else:
+            await flash('Invalid username or password.', 'error')
+            return redirect(url_for('login', next=next_post))
+
+    return await render_template('login.html', next_url=next_url)
+
+
+@app.route('/logout')
+async def logout():
+    session.clear()
+    await flash('You have been logged out.', 'info')
+    return redirect(url_for('login'))
+
+async def send_deals_email():
+    """Background task to send deals emails"""
+    eastern_tz = pytz.timezone('US/Eastern')
+    now_eastern = datetime.now(eastern_tz)
+
+    subscribers = await get_all_subscribers()
+    if not subscribers:
+        print("No subscribers found for daily email")
+        return
+
+    await run_in_scrape_executor(scrape_and_send, "Today's Top Deals")
+    print(f"Daily email task finished at {now_eastern.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for personalised digest rendering.
+
+Simulates a subscriber base (default 50,000) spread over a realistic number
+of preference signatures and compares:
+
+- naive: one render_digest (deal selection + multipart MIME build) per
+  recipient (timed on a sample and extrapolated)
+- grouped: one render per unique signature, in-process
+- grouped + pool: the same, across 1..N worker processes
+
+    python benchmarks/digest_bench.py --recipients 50000 --signatures 400
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import digest  # noqa: E402
+
+CATEGORIES = ['Computers & Electronics', 'Home & Garden', 'Groceries', 'Apparel', 'Automotive',
+              'Financial Services', 'Cell Phones', 'Entertainment', 'Sports & Fitness', 'Other']
+
+
+def load_deals(count):
+    with open(os.path.join(ROOT, 'rfd_data.json'), encoding='utf-8') as f:
+        base = json.load(f)
+    rng = random.Random(7)
+    deals = []
+    for i in range(count):
+        deal = dict(base[i % len(base)])
+        deal['thread_id'] = str(int(deal.get('thread_id') or 0) + i)
+        deal['category'] = rng.choice(CATEGORIES)
+        deals.append(deal)
+    return deals
+
+def make_signatures(count, rng):
+    pool = set()
+    subsets = [()] + [combo for r in (1, 2, 3) for combo in itertools.combinations(CATEGORIES, r)]
+    while len(pool) < count:
+        pool.add(digest.preference_signature(rng.choice([5, 10, 15, 20, 25, 30]), rng.choice(subsets)))
+    return sorted(pool)
+
+def make_groups(recipients, signatures, rng):
+    # Skewed like real preferences: most people keep the defaults
+    weights = [1.0 / (rank + 1) for rank in range(len(signatures))]
+    groups = {}
+    for i, signature in enumerate(rng.choices(signatures, weights=weights, k=recipients)):
+        groups.setdefault(signature, []).append(f'user{i}@example.com')
+    return groups
+
+def reset_cache():
+    digest._cache['fingerprint'] = None
+    digest._cache['messages'] = {}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark personalised digest rendering')
+    parser.add_argument('--recipients', type=int, default=50_000)
+    parser.add_argument('--signatures', type=int, default=400)
+    parser.add_argument('--deals', type=int, default=200)
+    parser.add_argument('--naive-sample', type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    deals = load_deals(args.deals)
+    groups = make_groups(args.recipients, make_signatures(args.signatures, rng), rng)
+    subject, sender = "Today's Top Deals", 'bench@example.com'
+    print(f"{args.recipients:,} recipients, {len(groups)} unique signatures, {len(deals)} deals, "
+          f"{os.cpu_count()} CPUs\n")
+
+    recipient_signatures = [sig for sig, emails in groups.items() for _ in emails]
+    sample = rng.sample(recipient_signatures, min(args.naive_sample, len(recipient_signatures)))
+    started = time.perf_counter()
+    for signature in sample:
+        digest.render_digest(deals, signature, subject, sender)
+    naive = (time.perf_counter() - started) / len(sample) * len(recipient_signatures)
+    print(f"{'naive per-recipient':<24}{naive:>9.2f}s  (extrapolated from {len(sample):,})")
+
+    worker_counts = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+    baseline = None
+    for workers in worker_counts:
+        if workers > (os.cpu_count() or 1):
+            continue
+        reset_cache()
+        started = time.perf_counter()
+        rendered = digest.render_digests(deals, groups.keys(), subject, sender, workers=workers, quiet=True)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        label = 'grouped, in-process' if workers == 1 else f'grouped, {workers} workers'
+        print(f"{label:<24}{elapsed:>9.2f}s  speedup vs 1 worker {baseline / elapsed:>5.2f}x, "
+              f"vs naive {naive / elapsed:>7.1f}x")
+
+    started = time.perf_counter()
+    digest.render_digests(deals, groups.keys(), subject, sender, quiet=True)
+    print(f"{'cached re-render':<24}{time.perf_counter() - started:>9.4f}s")
+    total_bytes = sum(len(message) for message in rendered.values())
+    print(f"\n{len(rendered)} rendered messages, {total_bytes / 1e6:.1f} MB total")
+
+if __name__ == '__main__':
+    main()
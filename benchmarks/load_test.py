@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Load test for comparing the WSGI (app.py) and ASGI (async_app.py) modes.
+
+Start one server at a time on the same box, then point this script at it:
+
+    gunicorn -w 4 --threads 4 -b 127.0.0.1:5000 app:app
+    hypercorn -w 4 -b 127.0.0.1:5001 async_app:app
+
+    python benchmarks/load_test.py http://127.0.0.1:5000 --label wsgi
+    python benchmarks/load_test.py http://127.0.0.1:5001 --label asgi
+
+Each client thread keeps one HTTP/1.1 keep-alive connection and replays a mix
+of GET /, GET /search (a full-text query against deals.db, so the server
+waits on SQLite rather than just rendering a template) and POST /subscribe
+requests. Build a search archive first, e.g. with
+benchmarks/search_bench.py --db deals.db, or the searches only hit an
+empty index. Reports requests/second and
+p50/p95/p99 latency. Only uses the standard library.
+"""
+
+import argparse
+import http.client
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlencode, urlsplit
+
+SEARCH_TERMS = ['laptop', 'costco', 'tv', 'amazon', 'headphones', 'walmart', 'ssd', 'best buy']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def worker(host, port, deadline, subscribe_ratio, search_ratio, latencies, errors, lock):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    count = 0
+
+    while time.perf_counter() < deadline:
+        count += 1
+        try:
+            start = time.perf_counter()
+            if subscribe_ratio and count % subscribe_ratio == 0:
+                body = urlencode({'email': f'load-{uuid.uuid4().hex}@example.com'})
+                conn.request('POST', '/subscribe', body=body,
+                             headers={'Content-Type': 'application/x-www-form-urlencoded'})
+            elif search_ratio and count % search_ratio == 0:
+                term = SEARCH_TERMS[count % len(SEARCH_TERMS)]
+                conn.request('GET', f'/search?q={quote(term)}')
+            else:
+                conn.request('GET', '/')
+            response = conn.getresponse()
+            response.read()
+            local_latencies.append(time.perf_counter() - start)
+            if response.status >= 400:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+def run(url, concurrency, duration, subscribe_ratio, search_ratio):
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    threads = [
+        threading.Thread(target=worker, args=(host, port, deadline, subscribe_ratio, search_ratio,
+                                                latencies, errors, lock))
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the RFD Daily Deals web app')
+    parser.add_argument('url', help='Base URL of the running server, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--label', default='', help='Name to print with the results (e.g. wsgi, asgi)')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=15.0, help='Seconds to run')
+    parser.add_argument('--subscribe-every', type=int, default=10,
+                        help='Send a POST /subscribe every N requests per client (0 disables)')
+    parser.add_argument('--search-every', type=int, default=3,
+                        help='Send a GET /search every N requests per client (0 disables)')
+    args = parser.parse_args()
+
+    result = run(args.url, args.concurrency, args.duration, args.subscribe_every, args.search_every)
+    label = f"[{args.label}] " if args.label else ""
+    print(f"{label}{result['requests']} requests, {result['errors']} errors, "
+          f"{result['rps']:.1f} req/s | mean {result['mean_ms']:.1f} ms | "
+          f"p50 {result['p50_ms']:.1f} ms | p95 {result['p95_ms']:.1f} ms | p99 {result['p99_ms']:.1f} ms")
+
+if __name__ == '__main__':
+    main()
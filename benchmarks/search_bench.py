@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the FTS5 deal search.
+
+Builds a synthetic archive (default one million deals) in a temporary
+database through search.index_deals(), then times a mix of queries:
+rare and common terms, prefix queries, date-filtered queries and a deep
+keyset-paginated walk. Reports p50/p95/max latency per query.
+
+    python benchmarks/search_bench.py --deals 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import connect, index_deals, search_deals  # noqa: E402
+
+RETAILERS = ['Costco', 'Amazon.ca', 'Walmart', 'Best Buy', 'IKEA', 'Canadian Tire', 'Staples',
+             'The Source', 'Home Depot', 'Lowes', 'Sport Chek', 'Dollarama', 'Shoppers', 'Dell', 'Newegg']
+BRANDS = ['Dyson', 'Samsung', 'LG', 'Sony', 'Apple', 'Lenovo', 'Ninja', 'Instant Pot', 'DeWalt',
+          'Milwaukee', 'Nintendo', 'Logitech', 'Philips', 'Bose', 'Anker', 'Kirkland', 'Lego', 'Asus']
+PRODUCTS = ['vacuum', 'tv', 'laptop', 'headphones', 'air fryer', 'drill', 'monitor', 'switch',
+            'keyboard', 'mouse', 'speaker', 'charger', 'blender', 'coffee maker', 'tablet', 'router']
+WORDS = ['sale', 'clearance', 'ymmv', 'price match', 'free shipping', 'bogo', 'pricing error',
+         'in store', 'online', 'lowest ever', 'black friday', 'boxing day', 'coupon', 'promo code']
+
+QUERIES = [
+    ('rare term', {'query': 'pricing error bose'}),
+    ('common term', {'query': 'costco'}),
+    ('brand + product', {'query': 'dyson vacuum'}),
+    ('prefix', {'query': 'headph*'}),
+    ('short prefix', {'query': 'bl*'}),
+    ('last 30 days', {'query': 'samsung tv', 'days': 30}),
+    ('author', {'query': 'user42'}),
+    ('author prefix', {'query': 'user42*'}),
+]
+
+
+def synthetic_deals(count, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    span = (datetime.now(timezone.utc) - start).total_seconds()
+    for i in range(count):
+        retailer = rng.choice(RETAILERS)
+        title = f"[{retailer}] {rng.choice(BRANDS)} {rng.choice(PRODUCTS)} ${rng.randint(5, 2000)} {rng.choice(WORDS)}"
+        yield {
+            'thread_id': str(1_000_000 + i),
+            'title': title,
+            'author': f"user{rng.randint(1, 50_000)}",
+            'retailer': retailer,
+            'url': f"https://forums.redflagdeals.com/deal-{i}/",
+            'posted_at': (start + timedelta(seconds=rng.random() * span)).isoformat(),
+        }
+
+def build_archive(db_path, count, batch=50_000):
+    started = time.perf_counter()
+    deals = synthetic_deals(count)
+    done = 0
+    while done < count:
+        chunk = [next(deals) for _ in range(min(batch, count - done))]
+        index_deals(chunk, db_path)
+        done += len(chunk)
+        print(f"  indexed {done:,} deals ({time.perf_counter() - started:.1f}s)", end='\r')
+    print()
+    conn = connect(db_path)
+    conn.execute("INSERT INTO deals_fts (deals_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - started
+
+def time_query(conn, params, repeat):
+    timings = []
+    results = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results, _ = search_deals(conn=conn, **params)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings, len(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FTS5 deal search')
+    parser.add_argument('--deals', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=50, help='Pages to walk in the pagination test')
+    parser.add_argument('--db', help='Reuse/keep an archive at this path instead of a temp file')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'deals_bench.db')
+    conn = connect(db_path)
+    existing = conn.execute('SELECT COUNT(*) FROM deals').fetchone()[0]
+    conn.close()
+    if existing < args.deals:
+        print(f"Building archive of {args.deals:,} deals in {db_path}")
+        elapsed = build_archive(db_path, args.deals)
+        print(f"Built in {elapsed:.1f}s ({args.deals / elapsed:,.0f} deals/s), "
+              f"{os.path.getsize(db_path) / 1e6:.0f} MB on disk")
+
+    conn = connect(db_path)
+    now = int(datetime.now(timezone.utc).timestamp())
+    print(f"\n{'query':<18}{'hits':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for label, spec in QUERIES:
+        params = {'query': spec['query']}
+        if 'days' in spec:
+            params['since'] = now - spec['days'] * 86400
+        timings, hits = time_query(conn, params, args.repeat)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{label:<18}{hits:>6}{statistics.median(timings):>10.2f}{p95:>10.2f}{timings[-1]:>10.2f}")
+
+    cursor = None
+    page_timings = []
+    for _ in range(args.pages):
+        started = time.perf_counter()
+        _, cursor = search_deals('dyson vacuum', cursor=cursor, conn=conn)
+        page_timings.append((time.perf_counter() - started) * 1000)
+        if not cursor:
+            break
+    print(f"\nKeyset pagination over {len(page_timings)} pages: "
+          f"first {page_timings[0]:.2f} ms, last {page_timings[-1]:.2f} ms, "
+          f"median {statistics.median(page_timings):.2f} ms")
+    conn.close()
+
+if __name__ == '__main__':
+    main()
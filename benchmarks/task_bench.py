@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Per-cycle cost of the 2-minute task: cron-per-run vs the warm daemon.
+
+Both modes run the same dry-run cycle (subscribers, scrape, index, dedup,
+render) against debug_page.html served from a local keep-alive HTTP
+server, with throwaway databases:
+
+- cron: a fresh interpreter per cycle, as the task scheduler runs it
+- daemon: run_cycle() repeatedly in one process with WarmConnections
+
+CPU time includes user and system time. CPU-seconds/day assumes 720
+cycles a day; the daemon's idle wait between cycles is a blocking sleep.
+With --live it also times the TLS handshakes to RFD and Gmail, which a
+cron run repeats every cycle and the daemon does once.
+
+    python benchmarks/task_bench.py --cycles 10
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import resource
+import socket
+import sqlite3
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+CYCLES_PER_DAY = 24 * 60 // 2
+
+
+class KeepAliveHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+def serve_page():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(KeepAliveHandler, directory=ROOT))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_subscribers(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE subscribers (id INTEGER PRIMARY KEY, email TEXT UNIQUE NOT NULL, '
+                 'subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1)')
+    conn.executemany('INSERT INTO subscribers (email) VALUES (?)', [(f'user{i}@example.com',) for i in range(count)])
+    conn.commit()
+    conn.close()
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def own_cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def summarise(label, walls, cpus):
+    cpu = statistics.mean(cpus)
+    print(f"{label:<10}{statistics.median(walls) * 1000:>9.0f} ms{max(walls) * 1000:>9.0f} ms"
+          f"{cpu * 1000:>11.0f} ms{cpu * CYCLES_PER_DAY:>12.0f} s")
+    return cpu
+
+def tls_handshake(host, port):
+    context = ssl.create_default_context()
+    started = time.perf_counter()
+    with socket.create_connection((host, port), timeout=10) as sock:
+        with context.wrap_socket(sock, server_hostname=host):
+            return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cron-per-run and daemon task cycles')
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--subscribers', type=int, default=1_000)
+    parser.add_argument('--live', action='store_true', help='also time TLS handshakes to RFD and Gmail')
+    args = parser.parse_args()
+
+    server = serve_page()
+    tmp = tempfile.TemporaryDirectory()
+    subscribers_db = os.path.join(tmp.name, 'subscribers.db')
+    make_subscribers(subscribers_db, args.subscribers)
+    os.environ.update({
+        'RFD_URL': f'http://127.0.0.1:{server.server_port}/debug_page.html',
+        'SUBSCRIBERS_DB_PATH': subscribers_db,
+        'DEALS_DB_PATH': os.path.join(tmp.name, 'deals.db'),
+        'TASK_LOCK_FILE': os.path.join(tmp.name, 'task.pid'),
+    })
+    task = os.path.join(ROOT, 'pythonanywhere_task.py')
+
+    print(f"{args.cycles} cycles, {args.subscribers:,} subscribers, {os.cpu_count()} CPUs\n")
+    print(f"{'':<10}{'p50 wall':>12}{'max wall':>12}{'CPU/cycle':>14}{'CPU-s/day':>14}")
+
+    # Prime the deals database so both modes see the same steady state
+    subprocess.run([sys.executable, task, '--dry-run'], check=True, capture_output=True)
+    walls, cpus = [], []
+    for _ in range(args.cycles):
+        cpu_before = children_cpu()
+        started = time.perf_counter()
+        subprocess.run([sys.executable, task, '--dry-run'], check=True, capture_output=True)
+        walls.append(time.perf_counter() - started)
+        cpus.append(children_cpu() - cpu_before)
+    cron_cpu = summarise('cron', walls, cpus)
+    cron_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    import pythonanywhere_task  # noqa: E402 - reads the environment set above
+    warm = pythonanywhere_task.WarmConnections()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pythonanywhere_task.run_cycle(warm, dry_run=True)
+    walls, cpus = [], []
+    for _ in range(args.cycles):
+        cpu_before = own_cpu()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pythonanywhere_task.run_cycle(warm, dry_run=True)
+        walls.append(time.perf_counter() - started)
+        cpus.append(own_cpu() - cpu_before)
+    daemon_cpu = summarise('daemon', walls, cpus)
+    warm.close()
+
+    print(f"\nDaemon uses {cron_cpu / daemon_cpu:.1f}x less CPU per cycle, "
+          f"saving {(cron_cpu - daemon_cpu) * CYCLES_PER_DAY:.0f} CPU-seconds/day; "
+          f"it holds ~{cron_rss / 1024:.0f} MB resident between cycles")
+
+    if args.live:
+        print()
+        for host, port in (('forums.redflagdeals.com', 443), ('smtp.gmail.com', 465)):
+            try:
+                handshakes = [tls_handshake(host, port) for _ in range(3)]
+            except OSError as e:
+                print(f"{host}: {e}")
+                continue
+            print(f"TLS to {host:<24}{statistics.median(handshakes) * 1000:>6.0f} ms per cron cycle, once per daemon")
+    server.shutdown()
+    tmp.cleanup()
+
+if __name__ == '__main__':
+    main()
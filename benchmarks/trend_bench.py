@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark for incremental trend tracking.
+
+Simulates a day of 2-minute scrapes over a churning front page: each
+scrape sees --page threads, and a few drop off and are replaced by new
+ones every cycle. Compares the incremental tracker against rescanning
+every thread's full history to rank the fastest risers, and shows that
+the number of tracked threads stays bounded.
+
+    python benchmarks/trend_bench.py --scrapes 720 --page 30
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from trend import TREND_WINDOW, TrendTracker  # noqa: E402
+
+
+def simulate(scrapes, page, churn, rng):
+    """Yield (timestamp, deals) for each scrape"""
+    next_id = 0
+    live = {}
+    timestamp = 1_700_000_000
+    for _ in range(scrapes):
+        while len(live) < page:
+            live[str(next_id)] = [rng.randint(0, 5_000), rng.randint(0, 20), rng.uniform(0, 300)]
+            next_id += 1
+        for thread_id in rng.sample(sorted(live), churn):
+            del live[thread_id]
+        deals = []
+        for thread_id, counts in live.items():
+            counts[0] += int(counts[2] * rng.uniform(0.5, 1.5))
+            counts[1] += rng.random() < counts[2] / 500
+            deals.append({'thread_id': thread_id, 'rating': f"{counts[0]:,} views", 'votes': str(counts[1])})
+        yield timestamp, deals
+        timestamp += 120
+
+def rescan_top(history, k):
+    """Rank threads by recomputing velocity from their whole history"""
+    scored = []
+    for thread_id, samples in history.items():
+        window = samples[-TREND_WINDOW:]
+        if len(window) < 2:
+            continue
+        hours = (window[-1][0] - window[0][0]) / 3600
+        scored.append(((window[-1][1] - window[0][1]) / hours, thread_id))
+    return sorted(scored, reverse=True)[:k]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark incremental trend tracking')
+    parser.add_argument('--scrapes', type=int, default=720)
+    parser.add_argument('--page', type=int, default=30)
+    parser.add_argument('--churn', type=int, default=2)
+    args = parser.parse_args()
+
+    scrapes = list(simulate(args.scrapes, args.page, args.churn, random.Random(3)))
+    updates = sum(len(deals) for _, deals in scrapes)
+
+    tracker = TrendTracker()
+    peak = 0
+    started = time.perf_counter()
+    for timestamp, deals in scrapes:
+        tracker.observe(deals, timestamp)
+        peak = max(peak, len(tracker))
+    incremental = time.perf_counter() - started
+
+    history = {}
+    started = time.perf_counter()
+    for timestamp, deals in scrapes:
+        for deal in deals:
+            views = int(deal['rating'].split()[0].replace(',', ''))
+            history.setdefault(deal['thread_id'], []).append((timestamp, views))
+        rescan_top(history, tracker.top_k)
+    rescan = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(1_000):
+        tracker.top()
+    read = (time.perf_counter() - started) / 1_000
+
+    print(f"{args.scrapes} scrapes, {updates:,} updates, {len(history):,} threads seen\n")
+    print(f"{'incremental tracker':<24}{incremental * 1000:>8.1f} ms  {incremental / updates * 1e6:>6.2f} us/update")
+    print(f"{'rescan full history':<24}{rescan * 1000:>8.1f} ms  {rescan / updates * 1e6:>6.2f} us/update")
+    print(f"{'top-K read':<24}{read * 1e6:>8.2f} us")
+    print(f"\nTracked threads: peak {peak}, now {len(tracker)} (history holds {len(history):,})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark for per-recipient unsubscribe links at send time.
+
+Measures, for N recipients (default 100,000): bulk token generation,
+splicing each recipient's link and List-Unsubscribe headers into the
+shared digest bytes, and token verification. Also times the batched
+unsubscribe writer against one UPDATE per request.
+
+    python benchmarks/unsubscribe_bench.py --recipients 100000
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PUBLIC_BASE_URL', 'https://deals.example.com')
+os.environ.setdefault('UNSUBSCRIBE_SECRET', 'benchmark-secret')
+
+import unsubscribe  # noqa: E402
+from message_builder import build_digest_message  # noqa: E402
+
+
+def timed(label, func, count):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34}{elapsed:>8.3f}s  {elapsed / count * 1e6:>7.2f} us/recipient")
+    return result
+
+def make_db(path, emails):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE subscribers (id INTEGER PRIMARY KEY, email TEXT UNIQUE NOT NULL, '
+                 'is_active BOOLEAN DEFAULT 1, reactivated_at REAL)')
+    conn.executemany('INSERT INTO subscribers (email) VALUES (?)', [(e,) for e in emails])
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark signed unsubscribe links')
+    parser.add_argument('--recipients', type=int, default=100_000)
+    parser.add_argument('--unsubscribes', type=int, default=5_000)
+    args = parser.parse_args()
+
+    emails = [f'user{i}@example.com' for i in range(args.recipients)]
+    with open(os.path.join(ROOT, 'rfd_data.json'), encoding='utf-8') as f:
+        deals = json.load(f)
+    message, stats = build_digest_message(deals, "Today's Top Deals", 'bench@example.com', personalised=True)
+    print(f"{args.recipients:,} recipients, shared digest {stats['bytes'] / 1024:.1f} KB\n")
+
+    tokens = timed('bulk token generation', lambda: unsubscribe.make_tokens(emails), args.recipients)
+    parts = unsubscribe.split_message(message)
+
+    def splice():
+        # Each message is handed to SMTP and dropped, so don't keep them all
+        for token in tokens:
+            unsubscribe.personalise_message(parts, token)
+    timed('splice link + headers', splice, args.recipients)
+    timed('verify tokens', lambda: [unsubscribe.verify_token(t) for t in tokens], args.recipients)
+
+    count = min(args.unsubscribes, args.recipients)
+    targets = emails[:count]
+    print()
+    with tempfile.TemporaryDirectory() as tmp:
+        single_db = os.path.join(tmp, 'single.db')
+        make_db(single_db, emails)
+
+        def one_by_one():
+            for email in targets:
+                conn = sqlite3.connect(single_db)
+                conn.execute('UPDATE subscribers SET is_active = 0 WHERE email = ?', (email,))
+                conn.commit()
+                conn.close()
+        timed(f'{count:,} unsubscribes, one UPDATE each', one_by_one, count)
+
+        batched_db = os.path.join(tmp, 'batched.db')
+        make_db(batched_db, emails)
+        batcher = unsubscribe.UnsubscribeBatcher(batched_db, batch_size=count + 1, flush_seconds=60)
+
+        def batched():
+            for email in targets:
+                batcher.add(email)
+            batcher.flush()
+        timed(f'{count:,} unsubscribes, batched', batched, count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Near-duplicate deal clustering for scraped RFD threads.
+
+RFD often has several threads for the same product or promotion, and the
+sponsored posts sit at the top of every page. This module collapses those
+before the digest is built:
+
+- titles are normalised and split into character shingles
+- each title gets a MinHash signature
+- signatures are banded into an LSH index kept in SQLite, so each new
+  deal is only compared against the few historical deals that share a
+  bucket with it, never against the whole archive
+
+The index persists across runs, so a thread seen yesterday keeps its
+cluster id and new threads are clustered incrementally against history.
+"""
+
+import os
+import re
+import random
+import sqlite3
+import struct
+import unicodedata
+import zlib
+from array import array
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Relative paths resolve against this directory, not the working directory,
+# so the scheduled task and the web app always open the same file
+DEALS_DB_PATH = os.path.join(SCRIPT_DIR, os.getenv('DEALS_DB_PATH', 'deals.db'))
+FILTER_SPONSORED = os.getenv('FILTER_SPONSORED', 'true').lower() in ('1', 'true', 'yes')
+
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+# Estimated Jaccard similarity needed to join an existing cluster. With
+# 16 bands of 4 rows the LSH S-curve is centred near 0.5, so candidates
+# above this threshold are found with high probability.
+SIMILARITY_THRESHOLD = 0.6
+# Titles that normalise to fewer characters than this (emoji-only, CJK or
+# all punctuation normalise to '') hash to a single shingle that unrelated
+# titles share, so they keep their own thread id and are never indexed
+MIN_TITLE_CHARS = SHINGLE_SIZE
+
+SPONSORED_AUTHOR = 'RedFlagDeals.com'
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed so signatures stay comparable with the persisted index
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_SPONSORED_RE = re.compile(r'^\s*\[sponsored\]\s*', re.IGNORECASE)
+_NON_WORD_RE = re.compile(r'[^a-z0-9$%.]+')
+
+
+def is_sponsored(deal):
+    """True for RFD's own sponsored posts"""
+    return bool(_SPONSORED_RE.match(deal.get('title', ''))) or deal.get('author') == SPONSORED_AUTHOR
+
+def normalise_title(title):
+    """Lowercase, strip accents, tags and punctuation, collapse whitespace"""
+    title = _SPONSORED_RE.sub('', title)
+    title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    title = _NON_WORD_RE.sub(' ', title.lower())
+    return ' '.join(title.split())
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Set of character k-shingles, hashed to stable 32-bit ints"""
+    if len(text) <= k:
+        return {zlib.crc32(text.encode('utf-8'))}
+    encoded = text.encode('utf-8')
+    return {zlib.crc32(encoded[i:i + k]) for i in range(len(encoded) - k + 1)}
+
+def minhash(shingle_set):
+    """MinHash signature of a set of hashed shingles"""
+    signature = array('I', [_MAX_HASH]) * NUM_PERM
+    for i, (a, b) in enumerate(_PERMUTATIONS):
+        signature[i] = min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in shingle_set)
+    return signature
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+def band_hashes(signature):
+    """One bucket key per LSH band"""
+    return [
+        zlib.crc32(struct.pack(f'{ROWS_PER_BAND}I', *signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]))
+        for band in range(NUM_BANDS)
+    ]
+
+
+class LSHIndex:
+    """MinHash LSH index of deal titles persisted in SQLite"""
+
+    def __init__(self, db_path=DEALS_DB_PATH, conn=None):
+        self.own_conn = conn is None
+        self.conn = sqlite3.connect(db_path) if self.own_conn else conn
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS deal_signatures (
+                thread_id TEXT PRIMARY KEY,
+                cluster_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                thread_id TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, thread_id)
+            ) WITHOUT ROWID;
+        ''')
+
+    def close(self):
+        if self.own_conn:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.commit()
+        self.close()
+
+    def lookup(self, thread_id):
+        """Cluster id of a thread already in the index, or None"""
+        row = self.conn.execute(
+            'SELECT cluster_id FROM deal_signatures WHERE thread_id = ?', (thread_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def query(self, signature, bands=None):
+        """Cluster id of the most similar indexed deal above the threshold, or None"""
+        bands = bands if bands is not None else band_hashes(signature)
+        candidates = set()
+        for band, bucket in enumerate(bands):
+            rows = self.conn.execute(
+                'SELECT thread_id FROM lsh_buckets WHERE band = ? AND bucket = ?', (band, bucket)
+            )
+            candidates.update(row[0] for row in rows)
+
+        best_cluster, best_score = None, SIMILARITY_THRESHOLD
+        for thread_id in candidates:
+            cluster_id, blob = self.conn.execute(
+                'SELECT cluster_id, signature FROM deal_signatures WHERE thread_id = ?', (thread_id,)
+            ).fetchone()
+            score = estimate_similarity(signature, array('I', blob))
+            if score >= best_score:
+                best_cluster, best_score = cluster_id, score
+        return best_cluster
+
+    def add(self, thread_id, cluster_id, signature, bands=None):
+        bands = bands if bands is not None else band_hashes(signature)
+        self.conn.execute(
+            'INSERT OR IGNORE INTO deal_signatures (thread_id, cluster_id, signature) VALUES (?, ?, ?)',
+            (thread_id, cluster_id, signature.tobytes()),
+        )
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO lsh_buckets (band, bucket, thread_id) VALUES (?, ?, ?)',
+            [(band, bucket, thread_id) for band, bucket in enumerate(bands)],
+        )
+
+    def assign_cluster(self, deal):
+        """Cluster id for a deal, indexing it if it hasn't been seen before"""
+        thread_id = deal.get('thread_id') or deal.get('url') or deal.get('title', '')
+        title = normalise_title(deal.get('title', ''))
+        if len(title) < MIN_TITLE_CHARS:
+            # Also ignores rows such titles left in indexes built before this check
+            return thread_id
+        cluster_id = self.lookup(thread_id)
+        if cluster_id is not None:
+            return cluster_id
+
+        signature = minhash(shingles(title))
+        bands = band_hashes(signature)
+        cluster_id = self.query(signature, bands) or thread_id
+        self.add(thread_id, cluster_id, signature, bands)
+        return cluster_id
+
+
+def cluster_deals(deals, db_path=DEALS_DB_PATH, filter_sponsored=FILTER_SPONSORED, conn=None):
+    """
+    Collapse near-duplicate deals, keeping the first (highest on the page)
+    deal of each cluster. Each kept deal gets 'cluster_id' and
+    'cluster_size' keys. Pass an open connection to reuse it.
+    """
+    if filter_sponsored:
+        deals = [deal for deal in deals if not is_sponsored(deal)]
+
+    clustered = {}
+    with LSHIndex(db_path, conn) as index:
+        for deal in deals:
+            cluster_id = index.assign_cluster(deal)
+            if cluster_id in clustered:
+                clustered[cluster_id]['cluster_size'] += 1
+            else:
+                clustered[cluster_id] = dict(deal, cluster_id=cluster_id, cluster_size=1)
+
+    return list(clustered.values())
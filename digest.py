@@ -0,0 +1,233 @@
+"""
+Per-recipient digest rendering.
+
+Subscribers can choose how many deals they get and which categories they
+care about. Rendering one digest per recipient would mean building the same
+HTML thousands of times, so recipients are grouped by their preference
+signature and each unique digest is rendered exactly once:
+
+- signatures already rendered for the current deal list come from a cache
+- the remaining ones are rendered in a ProcessPoolExecutor whose workers
+  receive the deal list once, through the pool initializer, instead of it
+  being pickled into every task
+- each digest comes back as finished MIME bytes (see message_builder),
+  which deliver_digests() hands straight to SMTP in BCC chunks, or, when
+  signed unsubscribe links are enabled, per recipient with the link
+  spliced into the shared bytes
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import smtplib
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from message_builder import build_digest_message
+from scraper import num_deals
+from unsubscribe import links_enabled, make_tokens, personalise_message, split_message
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'subscribers.db')
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+# One digest renders in ~2-4 ms in-process, while starting a pool costs
+# 0.3-0.9 s, so with 2-4 workers the pool only pays off past a few hundred
+# cache misses; below this many, render in-process
+POOL_THRESHOLD = int(os.getenv('RENDER_POOL_THRESHOLD', 500))
+# BCC recipients per SMTP transaction; the same bytes are reused for each chunk
+RECIPIENT_CHUNK_SIZE = int(os.getenv('RECIPIENT_CHUNK_SIZE', 100))
+
+# Columns added to the subscribers table after the original schema
+SUBSCRIBER_COLUMNS = {
+    'num_deals': 'INTEGER',
+    'categories': 'TEXT',
+    # Epoch seconds of the latest subscribe; unsubscribes requested before it are ignored
+    'reactivated_at': 'REAL',
+}
+
+# The web apps render from processes that already run threads (server
+# threads, the scrape executor, the unsubscribe timer), which fork() can't
+# copy safely, so workers are started by a forkserver, or spawned where
+# that isn't available
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _MP_CONTEXT = multiprocessing.get_context('forkserver')
+    # The server imports this module once and each worker forks from it
+    _MP_CONTEXT.set_forkserver_preload(['digest'])
+else:
+    _MP_CONTEXT = multiprocessing.get_context('spawn')
+
+# Rendered MIME bytes for the current deal list, keyed by (subject, personalised, signature)
+_cache = {'fingerprint': None, 'messages': {}}
+
+# Set in each pool worker by _init_worker
+_worker_deals = None
+
+
+def ensure_subscriber_columns(conn):
+    """Add any missing SUBSCRIBER_COLUMNS to an existing subscribers table"""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(subscribers)')}
+    for column, column_type in SUBSCRIBER_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE subscribers ADD COLUMN {column} {column_type}')
+    conn.commit()
+
+def preference_signature(deal_count, categories):
+    """
+    Hashable key for everything that changes a digest's content. Empty
+    categories means all categories.
+    """
+    if isinstance(categories, str):
+        categories = categories.split(',')
+    cleaned = tuple(sorted({c.strip().lower() for c in categories or () if c.strip()}))
+    return (deal_count or num_deals, cleaned)
+
+def get_recipient_groups(db_path=DB_PATH, conn=None):
+    """
+    Active subscribers grouped by preference signature. Pass an open
+    connection to reuse it; otherwise one is opened for this call.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(db_path)
+    try:
+        ensure_subscriber_columns(conn)
+        rows = conn.execute(
+            'SELECT email, num_deals, categories FROM subscribers WHERE is_active = 1'
+        ).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+
+    groups = defaultdict(list)
+    for email, deal_count, categories in rows:
+        groups[preference_signature(deal_count, categories)].append(email)
+    return dict(groups)
+
+def select_deals(deals, signature):
+    """Deals matching a signature's categories, capped to its deal count"""
+    deal_count, categories = signature
+    if categories:
+        deals = [deal for deal in deals if deal.get('category', '').lower() in categories]
+    return deals[:deal_count]
+
+def render_digest(deals, signature, subject, sender, personalised=False):
+    """Finished MIME bytes and build stats for one preference signature"""
+    deal_count, _ = signature
+    return build_digest_message(select_deals(deals, signature), subject, sender, limit=deal_count,
+                                personalised=personalised)
+
+def _init_worker(deals):
+    global _worker_deals
+    _worker_deals = deals
+
+def _render_in_worker(signature, subject, sender, personalised):
+    return signature, render_digest(_worker_deals, signature, subject, sender, personalised)
+
+def report(stats, elapsed):
+    """Print message size and build time for the digests built this run"""
+    if not stats:
+        print(f"All digests served from cache ({elapsed * 1000:.1f} ms)")
+        return
+    sizes = [s['bytes'] for s in stats]
+    truncated = sum(1 for s in stats if s['truncated'])
+    print(f"Built {len(stats)} digests in {elapsed * 1000:.1f} ms "
+          f"(avg {sum(s['build_ms'] for s in stats) / len(stats):.1f} ms each), "
+          f"size avg {sum(sizes) / len(sizes) / 1024:.1f} KB, max {max(sizes) / 1024:.1f} KB, "
+          f"{truncated} truncated to fit the byte budget")
+
+def deals_fingerprint(deals):
+    return hashlib.sha1(json.dumps(deals, sort_keys=True).encode('utf-8')).hexdigest()
+
+def render_digests(deals, signatures, subject, sender, workers=RENDER_WORKERS, quiet=False, personalised=None):
+    """
+    Render each unique signature once and return {signature: mime_bytes}.
+    Cached renders are reused while the deal list is unchanged.
+    """
+    if personalised is None:
+        personalised = links_enabled()
+    fingerprint = deals_fingerprint(deals)
+    if _cache['fingerprint'] != fingerprint:
+        _cache['fingerprint'] = fingerprint
+        _cache['messages'] = {}
+    cache = _cache['messages']
+
+    rendered = {}
+    misses = []
+    for signature in set(signatures):
+        cached = cache.get((subject, personalised, signature))
+        if cached is not None:
+            rendered[signature] = cached
+        else:
+            misses.append(signature)
+
+    started = time.perf_counter()
+    stats = []
+    if workers > 1 and len(misses) >= POOL_THRESHOLD:
+        chunksize = max(1, len(misses) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT, initializer=_init_worker,
+                                 initargs=(deals,)) as pool:
+            results = list(pool.map(_render_in_worker, misses, [subject] * len(misses), [sender] * len(misses),
+                                    [personalised] * len(misses), chunksize=chunksize))
+    else:
+        results = [(signature, render_digest(deals, signature, subject, sender, personalised))
+                   for signature in misses]
+
+    for signature, (message, message_stats) in results:
+        rendered[signature] = message
+        cache[(subject, personalised, signature)] = message
+        stats.append(message_stats)
+
+    if not quiet:
+        report(stats, time.perf_counter() - started)
+    return rendered
+
+def deliver_digests(rendered, groups, sender, password, personalised=None, smtp_server=None):
+    """
+    Send every group its pre-rendered digest over one SMTP connection.
+    Pass a logged-in smtp_server to reuse a warm connection; otherwise one
+    is opened for this call.
+    """
+    if smtp_server is None:
+        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp_server:
+            smtp_server.login(sender, password)
+            return deliver_digests(rendered, groups, sender, password, personalised, smtp_server)
+
+    if personalised is None:
+        personalised = links_enabled()
+    sent = 0
+    for signature, recipients in groups.items():
+        message = rendered[signature]
+        if personalised:
+            # One transaction per recipient so each gets their own signed link
+            parts = split_message(message)
+            for email, token in zip(recipients, make_tokens(recipients)):
+                smtp_server.sendmail(sender, [email], personalise_message(parts, token))
+            sent += len(recipients)
+            continue
+        for start in range(0, len(recipients), RECIPIENT_CHUNK_SIZE):
+            chunk = recipients[start:start + RECIPIENT_CHUNK_SIZE]
+            # Send to BCC recipients (they won't see each other's email addresses)
+            smtp_server.sendmail(sender, chunk, message)
+            sent += len(chunk)
+    print(f"Sent {len(groups)} digest variants to {sent} recipients")
+    return sent
+
+def send_personalised_digests(deals, subject, sender, password, db_path=DB_PATH, conn=None, smtp_server=None,
+                              dry_run=False):
+    """
+    Group subscribers, render each unique digest once and deliver. conn and
+    smtp_server let a long-running caller reuse its connections. With
+    dry_run the digests are rendered but nothing is sent.
+    """
+    groups = get_recipient_groups(db_path, conn)
+    if not groups:
+        return 0
+    rendered = render_digests(deals, groups.keys(), subject, sender)
+    if dry_run:
+        recipients = sum(len(emails) for emails in groups.values())
+        print(f"Dry run: {len(groups)} digest variants for {recipients} recipients not sent")
+        return 0
+    return deliver_digests(rendered, groups, sender, password, smtp_server=smtp_server)
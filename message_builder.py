@@ -0,0 +1,149 @@
+"""
+Builds the digest email as finished wire bytes.
+
+Each digest is a multipart/alternative message with a text/plain part
+and a compact HTML part. The HTML has no <style> block: every element
+carries its rule inline, and each rule is a shared constant, so identical
+declarations are written once in the source and the output never carries
+unused CSS. Both parts use quoted-printable, which for mostly-ASCII deal
+titles comes out smaller than base64.
+
+Some clients clip large messages (Gmail at ~102 KB), and every extra byte
+is sent once per SMTP transaction. The deal list is therefore truncated to
+the largest prefix that keeps the wire size within MESSAGE_BYTE_BUDGET.
+The bytes are built once per digest and reused for every recipient chunk.
+
+With personalised=True the footer of each part gets a placeholder line
+that unsubscribe.personalise_message() swaps for the recipient's signed
+link at send time, so the body is still only rendered once.
+"""
+
+import html
+import os
+import time
+from email import charset
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from unsubscribe import HTML_PLACEHOLDER, TEXT_PLACEHOLDER
+
+MESSAGE_BYTE_BUDGET = int(os.getenv('MESSAGE_BYTE_BUDGET', 100_000))
+# Room left for the per-recipient unsubscribe link and headers
+PERSONALISATION_RESERVE = 1024
+FORUM_URL = 'https://forums.redflagdeals.com/hot-deals-f9/'
+
+_QP_UTF8 = charset.Charset('utf-8')
+_QP_UTF8.header_encoding = charset.QP
+_QP_UTF8.body_encoding = charset.QP
+
+# Inline styles, one per element type. Repeated for every deal, so they use
+# shorthand properties and lean on element defaults (<b> is already bold).
+BODY_STYLE = 'font-family:Arial,sans-serif;margin:20px'
+HEADER_STYLE = 'background:#e74c3c;color:#fff;padding:15px;border-radius:5px;margin-bottom:20px'
+DEAL_STYLE = 'border:1px solid #ddd;margin:10px 0;padding:15px;border-radius:5px;background:#f9f9f9'
+TITLE_STYLE = 'font-size:16px;color:#333'
+META_STYLE = 'font-size:12px;color:#666;margin:5px 0 10px'
+LINK_STYLE = 'color:#06c;text-decoration:none'
+FOOTER_STYLE = 'margin-top:20px;font-size:12px;color:#666'
+
+
+def _strip_placeholders(text):
+    """
+    Deal titles come from forum users, so one that spells out a placeholder
+    must not be mistaken for the real one. Repeat until nothing is left, in
+    case removing one occurrence joins the pieces of another.
+    """
+    markers = (HTML_PLACEHOLDER.decode(), TEXT_PLACEHOLDER.decode())
+    while any(marker in text for marker in markers):
+        for marker in markers:
+            text = text.replace(marker, '')
+    return text
+
+def _meta(deal):
+    meta = f"👤 {deal['author']} | 📅 {deal['created_at']} | 👁️ {deal['rating']} | {deal['vote_type']} {deal['votes']}"
+    if deal.get('views_per_hour'):
+        # Set by trend.TrendTracker.annotate() for the fastest-rising threads
+        meta += f" | 🚀 {deal['views_per_hour']:,.0f} views/h"
+    return meta
+
+def render_html(deals, total, personalised=False):
+    """Compact HTML body with inline styles"""
+    parts = [
+        f'<html><body><div style="{BODY_STYLE}">'
+        f'<div style="{HEADER_STYLE}"><h1>🔥 Today\'s Top RedFlagDeals</h1>'
+        f'<p>Found {total} hot deals for you!</p></div>'
+    ]
+    for i, deal in enumerate(deals, 1):
+        parts.append(
+            f'<div style="{DEAL_STYLE}">'
+            f'<b style="{TITLE_STYLE}">{i}. {html.escape(deal["title"])}</b>'
+            f'<div style="{META_STYLE}">{html.escape(_meta(deal))}</div>'
+            f'<a href="{html.escape(deal["url"], quote=True)}" style="{LINK_STYLE}">View Deal →</a>'
+            '</div>'
+        )
+    parts.append(
+        f'<p style="{FOOTER_STYLE}">Powered by RFD Scraper | '
+        f'<a href="{FORUM_URL}">View All Deals</a></p>'
+    )
+    parts = [_strip_placeholders(''.join(parts))]
+    if personalised:
+        # On its own line so quoted-printable never wraps it
+        parts.append(f'\n{HTML_PLACEHOLDER.decode()}\n')
+    parts.append('</div></body></html>')
+    return ''.join(parts)
+
+def render_text(deals, total, personalised=False):
+    """Plain-text body"""
+    lines = ["Today's Top RedFlagDeals", f"Found {total} hot deals for you!", ""]
+    for i, deal in enumerate(deals, 1):
+        lines.extend([f"{i}. {deal['title']}", f"   {_meta(deal)}", f"   {deal['url']}", ""])
+    lines.append(f"View all deals: {FORUM_URL}")
+    lines = [_strip_placeholders('\n'.join(lines))]
+    if personalised:
+        lines.append(TEXT_PLACEHOLDER.decode())
+    return '\n'.join(lines)
+
+def _wire_bytes(deals, total, subject, sender, personalised):
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = sender  # Set To field to sender to avoid showing recipients
+    msg.attach(MIMEText(render_text(deals, total, personalised), 'plain', _QP_UTF8))
+    msg.attach(MIMEText(render_html(deals, total, personalised), 'html', _QP_UTF8))
+    # smtplib sends bytes as-is, so produce SMTP line endings here
+    return msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+def build_digest_message(deals, subject, sender, limit=None, byte_budget=MESSAGE_BYTE_BUDGET, personalised=False):
+    """
+    Wire bytes for a digest of up to `limit` deals, truncated further if
+    needed to fit `byte_budget`. Returns (bytes, stats).
+    """
+    started = time.perf_counter()
+    if personalised and byte_budget:
+        byte_budget -= PERSONALISATION_RESERVE
+    total = len(deals)
+    deals = deals[:limit] if limit else deals
+
+    message = _wire_bytes(deals, total, subject, sender, personalised)
+    kept = len(deals)
+    if byte_budget and len(message) > byte_budget:
+        # Largest prefix of the deal list that fits, by binary search
+        low, high = 0, len(deals) - 1
+        message = _wire_bytes([], total, subject, sender, personalised)
+        kept = 0
+        while low <= high:
+            mid = (low + high + 1) // 2
+            candidate = _wire_bytes(deals[:mid], total, subject, sender, personalised)
+            if len(candidate) <= byte_budget:
+                message, kept = candidate, mid
+                low = mid + 1
+            else:
+                high = mid - 1
+
+    stats = {
+        'deals': kept,
+        'truncated': len(deals) - kept,
+        'bytes': len(message),
+        'build_ms': (time.perf_counter() - started) * 1000,
+    }
+    return message, stats
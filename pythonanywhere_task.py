@@ -1,20 +1,39 @@
 #!/usr/bin/env python3
 """
 PythonAnywhere Task Scheduler Script
-Run this script every 2 minutes via PythonAnywhere's task scheduler
+Run this script every 2 minutes via PythonAnywhere's task scheduler, or
+start it once in daemon mode to keep a single warm process running:
+
+    python pythonanywhere_task.py            # one run, then exit
+    python pythonanywhere_task.py --daemon   # one run every TASK_INTERVAL_SECONDS until SIGTERM
+
+The daemon keeps the HTTP session, SMTP login and database connections
+open between cycles, so each cycle skips interpreter startup, imports and
+TLS handshakes. Both modes take a lock on a PID file, so a scheduled run
+that finds the daemon (or a slow previous run) still alive exits at once.
 """
 
+import argparse
+import fcntl
 import os
+import random
+import signal
+import smtplib
 import sys
 import sqlite3
+import threading
+import time
 from datetime import datetime
 import pytz
 import requests
-from bs4 import BeautifulSoup
-import smtplib
-from email.mime.text import MIMEText
+from bs4 import BeautifulSoup, SoupStrainer
 from dotenv import load_dotenv
 
+from dedup import cluster_deals
+from search import DEALS_DB_PATH, connect as connect_deals_db, index_deals
+from digest import send_personalised_digests
+from trend import TrendTracker
+
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -24,42 +43,57 @@ load_dotenv(os.path.join(SCRIPT_DIR, '.env'))
 # Configuration
 EMAIL_SENDER = os.getenv('EMAIL_SENDER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
-NUM_DEALS = int(os.getenv('NUM_DEALS', 10))
+# Relative paths resolve against this directory, so runs started from any
+# working directory share the same database and lock file
+DB_PATH = os.path.join(SCRIPT_DIR, os.getenv('SUBSCRIBERS_DB_PATH', 'subscribers.db'))
+RFD_URL = os.getenv('RFD_URL', 'https://forums.redflagdeals.com/hot-deals-f9/')
 
-def get_subscribers():
+# Daemon mode
+TASK_INTERVAL = float(os.getenv('TASK_INTERVAL_SECONDS', 120))
+TASK_JITTER = float(os.getenv('TASK_JITTER_SECONDS', 5))
+LOCK_PATH = os.path.join(SCRIPT_DIR, os.getenv('TASK_LOCK_FILE', 'pythonanywhere_task.pid'))
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# Only topic rows are turned into a tree; the rest of the page is skipped
+TOPIC_STRAINER = SoupStrainer('li', class_=lambda classes: classes is not None and 'topic' in classes.split())
+
+def make_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    return session
+
+def get_subscribers(conn=None):
     """Get active subscribers from database"""
     try:
-        db_path = os.path.join(SCRIPT_DIR, 'subscribers.db')
-        conn = sqlite3.connect(db_path)
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute('SELECT email FROM subscribers WHERE is_active = 1')
         subscribers = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        if own_conn:
+            conn.close()
         return subscribers
     except Exception as e:
         print(f"Error getting subscribers: {e}")
         return []
 
-def scrape_rfd_forum():
-    """Scrape RedFlagDeals forum"""
-    url = "https://forums.redflagdeals.com/hot-deals-f9/"
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
-    
+def scrape_rfd_forum(session=None):
+    """Scrape RedFlagDeals forum, reusing `session` and its open connections if given"""
     try:
-        session = requests.Session()
-        session.headers.update(headers)
-        response = session.get(url, timeout=30, allow_redirects=True)
+        session = session or make_session()
+        response = session.get(RFD_URL, timeout=30, allow_redirects=True)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(response.text, 'html.parser', parse_only=TOPIC_STRAINER)
         topic_items = soup.find_all('li', class_='topic')
         
         print(f"Found {len(topic_items)} topic items")
@@ -76,8 +110,10 @@ def scrape_rfd_forum():
                 
                 time_elements = item.find_all('time')
                 created_at = ''
+                posted_at = ''
                 if time_elements:
                     created_at = time_elements[0].get_text(strip=True)
+                    posted_at = time_elements[0].get('datetime', '')
                 
                 views_element = item.find('div', class_='views')
                 rating = views_element.get_text(strip=True) if views_element else ''
@@ -102,14 +138,26 @@ def scrape_rfd_forum():
                 author_element = item.find('span', class_='author_name')
                 author = author_element.get_text(strip=True) if author_element else ''
                 
+                category_element = item.find(class_='thread_category')
+                category = category_element.get_text(strip=True) if category_element else ''
+                
+                dealer_element = item.find(class_='thread_dealer')
+                retailer = dealer_element.get_text(strip=True) if dealer_element else ''
+                
+                thread_id = item.get('data-thread-id', '')
+                
                 topic_data = {
                     'title': title,
                     'url': url,
                     'created_at': created_at,
+                    'posted_at': posted_at,
                     'rating': rating,
                     'votes': votes_count,
                     'vote_type': vote_type,
-                    'author': author
+                    'author': author,
+                    'retailer': retailer,
+                    'category': category,
+                    'thread_id': thread_id
                 }
                 
                 scraped_data.append(topic_data)
@@ -131,95 +179,74 @@ def scrape_rfd_forum():
         print(f"Unexpected error: {e}")
         return []
 
-def format_deals_email(deals_data):
-    """Format deals data into HTML email"""
-    if not deals_data:
-        return "<p>No deals found today.</p>"
-    
-    html_body = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-            .deal {{ 
-                border: 1px solid #ddd; 
-                margin: 10px 0; 
-                padding: 15px; 
-                border-radius: 5px;
-                background-color: #f9f9f9;
-            }}
-            .deal-title {{ 
-                font-size: 16px; 
-                font-weight: bold; 
-                color: #333; 
-                margin-bottom: 5px;
-            }}
-            .deal-meta {{ 
-                font-size: 12px; 
-                color: #666; 
-                margin-bottom: 10px;
-            }}
-            .deal-link {{ 
-                color: #0066cc; 
-                text-decoration: none;
-            }}
-            .header {{ 
-                background-color: #e74c3c; 
-                color: white; 
-                padding: 15px; 
-                border-radius: 5px;
-                margin-bottom: 20px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🔥 Today's Top RedFlagDeals</h1>
-            <p>Found {len(deals_data)} hot deals for you!</p>
-        </div>
+class WarmConnections:
     """
-    
-    for i, deal in enumerate(deals_data[:NUM_DEALS], 1): 
-        html_body += f"""
-        <div class="deal">
-            <div class="deal-title">{i}. {deal['title']}</div>
-            <div class="deal-meta">
-                👤 {deal['author']} | 📅 {deal['created_at']} | 👁️ {deal['rating']} | {deal['vote_type']} {deal['votes']}
-            </div>
-            <a href="{deal['url']}" class="deal-link" target="_blank">View Deal →</a>
-        </div>
-        """
-    
-    html_body += """
-        <p style="margin-top: 20px; font-size: 12px; color: #666;">
-            Powered by RFD Scraper | <a href="https://forums.redflagdeals.com/hot-deals-f9/" target="_blank">View All Deals</a>
-        </p>
-    </body>
-    </html>
+    Connections and trend state kept across daemon cycles. SMTP is opened
+    on first use and checked with NOOP before each reuse, since Gmail drops
+    idle sessions; a dead one is replaced with a fresh login.
     """
-    
-    return html_body
 
-def send_email(subject, body, sender, recipients, password):
-    """Send email to recipients"""
+    def __init__(self):
+        self.session = make_session()
+        self.db = sqlite3.connect(DB_PATH)
+        self.deals_db = connect_deals_db(DEALS_DB_PATH)
+        self.trends = TrendTracker.load(self.deals_db)
+        self._smtp = None
+
+    def smtp(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+        self._smtp = smtplib.SMTP_SSL('smtp.gmail.com', 465, timeout=30)
+        self._smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        return self._smtp
+
+    def _close_smtp(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def close(self):
+        self._close_smtp()
+        self.session.close()
+        self.db.close()
+        self.deals_db.close()
+
+def acquire_lock(path=LOCK_PATH):
+    """
+    Take an exclusive lock on the PID file, or return None if another run
+    holds it. The kernel drops the lock when the process dies, so a file
+    left behind by a crash never blocks the next start.
+    """
+    lock_file = open(path, 'a+')
     try:
-        msg = MIMEText(body, 'html')
-        msg['Subject'] = subject
-        msg['From'] = sender
-        msg['To'] = sender  # Set To field to sender to avoid showing recipients
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp_server:
-           smtp_server.login(sender, password)
-           smtp_server.sendmail(sender, recipients, msg.as_string())
-        
-        print(f"Email sent successfully to {len(recipients)} recipients")
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.seek(0)
+        pid = lock_file.read().strip() or 'unknown'
+        lock_file.close()
+        print(f"Another run is still in progress (pid {pid}), exiting")
+        return None
+    lock_file.truncate(0)
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    return lock_file
+
+def release_lock(lock_file):
+    lock_file.truncate(0)
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
 
-def main():
-    """Main function to run the task"""
+def run_cycle(warm, dry_run=False):
+    """One scrape-and-send pass. Returns False if it failed."""
     try:
         # Get current time in Eastern Time
         eastern_tz = pytz.timezone('US/Eastern')
@@ -228,46 +255,143 @@ def main():
         print(f"=== Task started at {now_eastern.strftime('%Y-%m-%d %H:%M:%S %Z')} ===")
         
         # Check if we have email credentials
-        if not EMAIL_SENDER or not EMAIL_PASSWORD:
+        if not dry_run and (not EMAIL_SENDER or not EMAIL_PASSWORD):
             print("ERROR: Email credentials not configured. Please set EMAIL_SENDER and EMAIL_PASSWORD in .env file")
-            return
+            return False
         
         # Get subscribers
-        subscribers = get_subscribers()
+        subscribers = get_subscribers(warm.db)
         if not subscribers:
             print("No active subscribers found")
-            return
+            return True
         
         print(f"Found {len(subscribers)} active subscribers")
         
         # Scrape deals
         print("Scraping RedFlagDeals...")
-        deals = scrape_rfd_forum()
+        deals = scrape_rfd_forum(warm.session)
         
         if deals:
             print(f"Found {len(deals)} deals")
+            index_deals(deals, conn=warm.deals_db)
+            rising = warm.trends.observe(deals)
+            warm.trends.save(warm.deals_db)
+            print(f"Tracking {len(warm.trends)} threads, {len(rising)} rising")
+            if warm.trends.entered:
+                print(f"Newly rising threads: {', '.join(warm.trends.entered)}")
+            deals = warm.trends.annotate(cluster_deals(deals, conn=warm.deals_db))
+            print(f"{len(deals)} deals after removing near-duplicates")
             
-            # Format and send email
-            email_body = format_deals_email(deals)
-            success = send_email(
-                "Today's Top Deals",
-                email_body,
-                EMAIL_SENDER,
-                subscribers,
-                EMAIL_PASSWORD
-            )
+            # Render one digest per preference group and send
+            try:
+                send_personalised_digests(
+                    deals,
+                    "Today's Top Deals",
+                    EMAIL_SENDER,
+                    EMAIL_PASSWORD,
+                    DB_PATH,
+                    conn=warm.db,
+                    smtp_server=None if dry_run else warm.smtp(),
+                    dry_run=dry_run
+                )
+                success = True
+            except Exception as e:
+                print(f"Error sending email: {e}")
+                success = False
             
             if success:
                 print("Task completed successfully")
             else:
                 print("Task failed - email sending error")
+            return success
         else:
             print("No deals found to send")
+            return True
             
     except Exception as e:
         print(f"Task failed with error: {e}")
         import traceback
         traceback.print_exc()
+        return False
+
+def main(dry_run=False):
+    """Main function to run the task once"""
+    lock = acquire_lock()
+    if lock is None:
+        return
+    warm = WarmConnections()
+    try:
+        run_cycle(warm, dry_run)
+    finally:
+        warm.close()
+        release_lock(lock)
+
+def run_daemon(interval=TASK_INTERVAL, jitter=TASK_JITTER, dry_run=False):
+    """
+    Run a cycle every `interval` seconds, plus or minus up to `jitter`,
+    until SIGTERM or SIGINT. A signal during a cycle lets it finish first.
+    """
+    lock = acquire_lock()
+    if lock is None:
+        return
+    # Log lines should reach the task log as they happen, not at exit
+    sys.stdout.reconfigure(line_buffering=True)
+    jitter = min(jitter, interval / 2)
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, stopping after the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Daemon started (pid {os.getpid()}), one cycle every {interval:g}s +/- {jitter:g}s")
+    warm = WarmConnections()
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    cycles = 0
+    busy = 0.0
+    slot = 0
+    try:
+        while not stop.is_set():
+            cycle_started = time.monotonic()
+            cycle_cpu = time.process_time()
+            run_cycle(warm, dry_run)
+            elapsed = time.monotonic() - cycle_started
+            cycles += 1
+            busy += elapsed
+            print(f"Cycle {cycles}: {elapsed * 1000:.0f} ms wall, "
+                  f"{(time.process_time() - cycle_cpu) * 1000:.0f} ms CPU")
+
+            # Slots sit on a fixed grid from the start time, so neither run
+            # time nor jitter accumulates into drift. Slots a slow cycle ran
+            # over are skipped rather than run back to back.
+            now = time.monotonic()
+            next_slot = max(slot + 1, int((now - started) // interval) + 1)
+            if next_slot > slot + 1:
+                print(f"Cycle overran, skipping {next_slot - slot - 1} slot(s)")
+            slot = next_slot
+            wake_at = started + slot * interval + random.uniform(-jitter, jitter)
+            stop.wait(max(0.0, wake_at - time.monotonic()))
+    finally:
+        warm.close()
+        release_lock(lock)
+        uptime = time.monotonic() - started
+        cpu = time.process_time() - cpu_started
+        if cycles:
+            print(f"Daemon stopped after {cycles} cycles in {uptime:.0f}s: "
+                  f"avg cycle {busy / cycles * 1000:.0f} ms, {cpu:.2f} CPU-seconds "
+                  f"({cpu / uptime * 86400:.0f} CPU-s/day)")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Scrape RedFlagDeals and email the digest to subscribers')
+    parser.add_argument('--daemon', action='store_true', help='keep running, one cycle every --interval seconds')
+    parser.add_argument('--interval', type=float, default=TASK_INTERVAL, help='seconds between cycles in daemon mode')
+    parser.add_argument('--jitter', type=float, default=TASK_JITTER, help='random +/- offset for each cycle, in seconds')
+    parser.add_argument('--dry-run', action='store_true', help="render the digests but don't send them")
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(args.interval, args.jitter, args.dry_run)
+    else:
+        main(args.dry_run)
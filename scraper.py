@@ -7,6 +7,8 @@ from email.mime.text import MIMEText
 import os
 from dotenv import load_dotenv
 
+from search import index_deals
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -140,9 +142,11 @@ def scrape_rfd_forum():
                 time_elements = item.find_all('time')
                 created_at = ''
                 updated_at = ''
+                posted_at = ''
                 
                 if time_elements:
                     created_at = time_elements[0].get_text(strip=True)
+                    posted_at = time_elements[0].get('datetime', '')
                     if len(time_elements) > 1:
                         updated_at = time_elements[-1].get_text(strip=True)
                     else:
@@ -175,6 +179,14 @@ def scrape_rfd_forum():
                 author_element = item.find('span', class_='author_name')
                 author = author_element.get_text(strip=True) if author_element else ''
                 
+                # Extract category
+                category_element = item.find(class_='thread_category')
+                category = category_element.get_text(strip=True) if category_element else ''
+                
+                # Extract retailer (the dealer pill, absent on some threads)
+                dealer_element = item.find(class_='thread_dealer')
+                retailer = dealer_element.get_text(strip=True) if dealer_element else ''
+                
                 # Extract thread ID
                 thread_id = item.get('data-thread-id', '')
                 
@@ -183,10 +195,13 @@ def scrape_rfd_forum():
                     'url': url,
                     'created_at': created_at,
                     'updated_at': updated_at,
+                    'posted_at': posted_at,
                     'rating': rating,
                     'votes': votes_count,
                     'vote_type': vote_type,
                     'author': author,
+                    'retailer': retailer,
+                    'category': category,
                     'thread_id': thread_id
                 }
                 
@@ -215,6 +230,8 @@ def main():
             json.dump(data, f, indent=2, ensure_ascii=False)
         print("\nData saved to rfd_data.json")
         
+        index_deals(data)
+        
         # Send email with scraped deals
         print("\nSending email with deals...")
         email_body = format_deals_email(data)
@@ -0,0 +1,250 @@
+"""
+Full-text search over every deal we have ever scraped.
+
+Deals are archived in the `deals` table of deals.db and indexed by an FTS5
+virtual table (title, author, retailer) kept in sync by triggers, so each
+scrape only touches the rows that are new or whose text changed. Searches
+are ranked with BM25, support prefix queries and date filters, and page
+with a keyset cursor instead of OFFSET so deep pages stay cheap.
+
+BM25 has to score every matching row, which is what makes very common
+terms slow on a large archive. Ranking is therefore limited to the newest
+MAX_CANDIDATES matches: a cheap rowid-ordered scan of the index finds the
+cut-off rowid first, and only rows above it are scored.
+"""
+
+import base64
+import json
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+from dedup import DEALS_DB_PATH
+
+# BM25 column weights for title, author, retailer
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_CANDIDATES = 5000
+
+_TOKEN_RE = re.compile(r'[\w$%.]+\*?', re.UNICODE)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS deals (
+        id INTEGER PRIMARY KEY,
+        thread_id TEXT UNIQUE NOT NULL,
+        title TEXT NOT NULL,
+        author TEXT,
+        retailer TEXT,
+        url TEXT,
+        posted_at INTEGER,
+        first_seen INTEGER NOT NULL,
+        last_seen INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS deals_posted_at ON deals (posted_at);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS deals_fts USING fts5(
+        title, author, retailer,
+        content='deals', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS deals_ai AFTER INSERT ON deals BEGIN
+        INSERT INTO deals_fts (rowid, title, author, retailer)
+        VALUES (new.id, new.title, new.author, new.retailer);
+    END;
+    CREATE TRIGGER IF NOT EXISTS deals_ad AFTER DELETE ON deals BEGIN
+        INSERT INTO deals_fts (deals_fts, rowid, title, author, retailer)
+        VALUES ('delete', old.id, old.title, old.author, old.retailer);
+    END;
+    CREATE TRIGGER IF NOT EXISTS deals_au AFTER UPDATE OF title, author, retailer ON deals BEGIN
+        INSERT INTO deals_fts (deals_fts, rowid, title, author, retailer)
+        VALUES ('delete', old.id, old.title, old.author, old.retailer);
+        INSERT INTO deals_fts (rowid, title, author, retailer)
+        VALUES (new.id, new.title, new.author, new.retailer);
+    END;
+'''
+
+
+def connect(db_path=DEALS_DB_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def parse_timestamp(value):
+    """ISO 8601 string (as in RFD's <time datetime>) to epoch seconds, or None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def index_deals(deals, db_path=DEALS_DB_PATH, conn=None):
+    """Archive scraped deals and update the FTS index incrementally"""
+    now = int(datetime.now(timezone.utc).timestamp())
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path)
+    try:
+        with conn:
+            for deal in deals:
+                thread_id = deal.get('thread_id') or deal.get('url')
+                if not thread_id:
+                    continue
+                title = deal.get('title', '')
+                author = deal.get('author', '')
+                retailer = deal.get('retailer', '')
+                conn.execute('''
+                    INSERT INTO deals (thread_id, title, author, retailer, url, posted_at, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (thread_id) DO UPDATE SET last_seen = excluded.last_seen
+                ''', (thread_id, title, author, retailer, deal.get('url', ''),
+                      parse_timestamp(deal.get('posted_at')) or now, now, now))
+                # Only rewrite the FTS row when the indexed text actually changed
+                conn.execute('''
+                    UPDATE deals SET title = ?, author = ?, retailer = ?
+                    WHERE thread_id = ? AND (title IS NOT ? OR author IS NOT ? OR retailer IS NOT ?)
+                ''', (title, author, retailer, thread_id, title, author, retailer))
+    finally:
+        if own_conn:
+            conn.close()
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression. Every term is quoted
+    so user input can't inject FTS syntax; a trailing '*' on a term makes
+    it a prefix query.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text or ''):
+        word = token.rstrip('*')
+        if word:
+            terms.append(f'"{word}"' + ('*' if token.endswith('*') else ''))
+    return ' '.join(terms)
+
+def encode_cursor(score, row_id, min_rowid):
+    payload = json.dumps([score, row_id, min_rowid]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(score, row_id, min_rowid) from encode_cursor(); ValueError if it is malformed"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(payload, list) or len(payload) != 3:
+        raise ValueError('Invalid cursor')
+    score, row_id, min_rowid = payload
+    return float(score), int(row_id), None if min_rowid is None else int(min_rowid)
+
+def parse_search_args(args):
+    """
+    search_deals() keyword arguments from a request's query string
+    (q/since/until/limit/cursor); dates are YYYY-MM-DD. Shared by the
+    Flask and Quart apps.
+    """
+    params = {
+        'query': args.get('q', '').strip(),
+        'limit': args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        'cursor': args.get('cursor') or None,
+    }
+    for name in ('since', 'until'):
+        value = args.get(name)
+        params[name] = None
+        if value:
+            day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            params[name] = int(day.timestamp())
+    return params
+
+def candidate_floor(conn, match, source, filters, params):
+    """Lowest rowid among the newest MAX_CANDIDATES matches, or None if there are fewer"""
+    row = conn.execute(f'''
+        SELECT deals_fts.rowid FROM {source}
+        WHERE deals_fts MATCH ? {filters}
+        ORDER BY deals_fts.rowid DESC LIMIT 1 OFFSET ?
+    ''', [match, *params, MAX_CANDIDATES - 1]).fetchone()
+    return row[0] if row else None
+
+def search_deals(query, since=None, until=None, limit=DEFAULT_PAGE_SIZE, cursor=None, db_path=DEALS_DB_PATH, conn=None):
+    """
+    Search archived deals.
+
+    `since`/`until` are epoch seconds bounding posted_at. Returns
+    (results, next_cursor); pass next_cursor back to get the next page,
+    it is None on the last page.
+    """
+    match = build_match_query(query)
+    if not match:
+        return [], None
+
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    # Without date filters both index scans stay inside FTS5 and the deals
+    # table is only read for the rows on this page
+    conditions, filter_params = [], []
+    if since is not None:
+        conditions.append('AND f.posted_at >= ?')
+        filter_params.append(since)
+    if until is not None:
+        conditions.append('AND f.posted_at < ?')
+        filter_params.append(until)
+    source = 'deals_fts'
+    if conditions:
+        source = 'deals_fts JOIN deals f ON f.id = deals_fts.rowid'
+    filters = ' '.join(conditions)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path)
+    try:
+        if cursor:
+            # The floor travels with the cursor so every page ranks the same candidates
+            score, row_id, min_rowid = decode_cursor(cursor)
+        else:
+            min_rowid = candidate_floor(conn, match, source, filters, filter_params)
+
+        ranked = [f'''
+            SELECT deals_fts.rowid AS id, bm25(deals_fts, {", ".join(str(w) for w in BM25_WEIGHTS)}) AS score
+            FROM {source}
+            WHERE deals_fts MATCH ? {filters}
+        ''']
+        params = [match, *filter_params]
+        if min_rowid is not None:
+            ranked.append('AND deals_fts.rowid >= ?')
+            params.append(min_rowid)
+        if cursor:
+            # bm25() is lower-is-better, so the next page continues after (score, id)
+            ranked.append('AND (score > ? OR (score = ? AND deals_fts.rowid > ?))')
+            params.extend([score, score, row_id])
+        ranked.append('ORDER BY score, id LIMIT ?')
+        params.append(limit + 1)
+
+        rows = conn.execute(f'''
+            SELECT d.id, d.thread_id, d.title, d.author, d.retailer, d.url, d.posted_at, r.score
+            FROM ({' '.join(ranked)}) r
+            JOIN deals d ON d.id = r.id
+            ORDER BY r.score, r.id
+        ''', params).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+
+    results = [
+        {
+            'thread_id': thread_id,
+            'title': title,
+            'author': author,
+            'retailer': retailer,
+            'url': url,
+            'posted_at': datetime.fromtimestamp(posted_at, timezone.utc).isoformat() if posted_at else None,
+            'score': score,
+        }
+        for _, thread_id, title, author, retailer, url, posted_at, score in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[7], last[0], min_rowid)
+    return results, next_cursor
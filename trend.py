@@ -0,0 +1,294 @@
+"""
+Incremental trend tracking for RFD threads.
+
+The listing only shows point-in-time view and vote counts; what makes a
+deal hot is how fast they grow. Every scrape feeds each thread's counts
+into a small ring buffer of (timestamp, views, votes) samples:
+
+- velocity is the change across the buffer divided by its time span,
+  read from the two ends of the deque, and acceleration is the change
+  in velocity since the previous sample, so an update is O(1)
+- scored threads are pushed onto a max-heap with lazy invalidation, so
+  the top-K fastest-rising threads are read off the heap instead of
+  rescanning every thread's history
+- threads are kept in least-recently-seen order and evicted once they
+  have not been seen for TREND_IDLE_SECONDS, which bounds memory
+
+Ring buffers persist in deals.db so the 2-minute task can resume them on
+each run, and the current top-K is written to the `trending` table for
+the web app and API. The web apps' own sends go through observe_scrape(),
+so their scrapes are recorded and their digests get the same badges.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+from search import DEALS_DB_PATH, connect
+
+# Samples kept per thread; with the 2-minute task this is a 10-minute window
+TREND_WINDOW = int(os.getenv('TREND_WINDOW', 6))
+TREND_TOP_K = int(os.getenv('TREND_TOP_K', 20))
+TREND_IDLE_SECONDS = float(os.getenv('TREND_IDLE_SECONDS', 30 * 60))
+TREND_MAX_THREADS = int(os.getenv('TREND_MAX_THREADS', 5000))
+# Roughly one viewer in a hundred votes, so this puts both rates on the same scale
+VOTE_WEIGHT = 100.0
+
+_COUNT_RE = re.compile(r'(-?[\d,]*\.?\d+)\s*([kKmM]?)')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS deal_trends (
+        thread_id TEXT PRIMARY KEY,
+        samples TEXT NOT NULL,
+        last_seen REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS trending (
+        rank INTEGER PRIMARY KEY,
+        thread_id TEXT NOT NULL,
+        views INTEGER,
+        votes INTEGER,
+        views_per_hour REAL,
+        votes_per_hour REAL,
+        acceleration REAL,
+        score REAL,
+        updated_at REAL
+    );
+'''
+
+
+def parse_count(text):
+    """'2,385 views' -> 2385, '1.2k' -> 1200, '-5' -> -5; None if there is no number"""
+    match = _COUNT_RE.search(text or '')
+    if not match:
+        return None
+    value = float(match.group(1).replace(',', ''))
+    value *= {'k': 1_000, 'm': 1_000_000}.get(match.group(2).lower(), 1)
+    return int(value)
+
+
+class ThreadTrend:
+    """Ring buffer of samples and the rates derived from it for one thread"""
+
+    __slots__ = ('samples', 'views_per_hour', 'votes_per_hour', 'acceleration', 'score', 'seq')
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.views_per_hour = None
+        self.votes_per_hour = None
+        self.acceleration = None
+        self.score = None
+        self.seq = None
+
+    @property
+    def last_seen(self):
+        return self.samples[-1][0]
+
+    def add(self, timestamp, views, votes):
+        """Append a sample and update the rates; False if it is not newer than the last one"""
+        if self.samples and timestamp <= self.samples[-1][0]:
+            return False
+        previous_ts = self.samples[-1][0] if self.samples else None
+        previous_rate = self.views_per_hour
+        # A full deque drops its oldest sample, so samples[0] is the window start
+        self.samples.append((timestamp, views, votes))
+        if len(self.samples) < 2:
+            return True
+        start_ts, start_views, start_votes = self.samples[0]
+        hours = (timestamp - start_ts) / 3600
+        self.views_per_hour = (views - start_views) / hours
+        self.votes_per_hour = (votes - start_votes) / hours
+        if previous_rate is not None:
+            self.acceleration = (self.views_per_hour - previous_rate) / ((timestamp - previous_ts) / 3600)
+        self.score = self.views_per_hour + VOTE_WEIGHT * self.votes_per_hour
+        return True
+
+
+class TrendTracker:
+    """Per-thread trends across scrapes with a top-K of the fastest-rising threads"""
+
+    def __init__(self, window=TREND_WINDOW, top_k=TREND_TOP_K, idle_seconds=TREND_IDLE_SECONDS,
+                 max_threads=TREND_MAX_THREADS):
+        self.window = window
+        self.top_k = top_k
+        self.idle_seconds = idle_seconds
+        self.max_threads = max_threads
+        # Least recently seen first, so eviction only ever looks at the front
+        self.threads = OrderedDict()
+        self._heap = []
+        self._counter = itertools.count()
+        self._top = None
+        self._previous_top = set()
+        self._dirty = set()
+        self._evicted = set()
+        # Thread ids that joined the top-K in the latest observe()
+        self.entered = []
+
+    def __len__(self):
+        return len(self.threads)
+
+    def get(self, thread_id):
+        return self.threads.get(thread_id)
+
+    def update(self, thread_id, views, votes, timestamp):
+        """Record one sample for a thread. O(1) apart from the heap push."""
+        trend = self.threads.get(thread_id)
+        if trend is None:
+            trend = self.threads[thread_id] = ThreadTrend(self.window)
+            self._evicted.discard(thread_id)
+        if not trend.add(timestamp, views, votes):
+            return trend
+        self.threads.move_to_end(thread_id)
+        self._dirty.add(thread_id)
+        if trend.score is not None:
+            # Older heap entries for this thread are now stale and skipped on read
+            trend.seq = next(self._counter)
+            heapq.heappush(self._heap, (-trend.score, trend.seq, thread_id))
+        self._top = None
+        return trend
+
+    def evict(self, now=None):
+        """Drop threads not seen for idle_seconds, and the oldest beyond max_threads"""
+        now = time.time() if now is None else now
+        cutoff = now - self.idle_seconds
+        while self.threads:
+            thread_id, trend = next(iter(self.threads.items()))
+            if trend.last_seen >= cutoff and len(self.threads) <= self.max_threads:
+                break
+            del self.threads[thread_id]
+            self._dirty.discard(thread_id)
+            self._evicted.add(thread_id)
+            self._top = None
+        # Stale entries pile up as scores change; rebuild once they dominate
+        if len(self._heap) > 4 * len(self.threads) + 64:
+            self._heap = [(-t.score, t.seq, thread_id) for thread_id, t in self.threads.items()
+                          if t.score is not None]
+            heapq.heapify(self._heap)
+
+    def top(self, k=None):
+        """[(thread_id, ThreadTrend)] for the k fastest-rising threads, fastest first"""
+        k = k or self.top_k
+        if self._top is None or len(self._top) < k:
+            found = []
+            while self._heap and len(found) < k:
+                neg_score, seq, thread_id = self._heap[0]
+                trend = self.threads.get(thread_id)
+                if trend is None or trend.seq != seq:
+                    heapq.heappop(self._heap)
+                    continue
+                if neg_score >= 0:
+                    # Only threads that are actually growing count as rising
+                    break
+                found.append(heapq.heappop(self._heap))
+            for entry in found:
+                heapq.heappush(self._heap, entry)
+            self._top = [(thread_id, self.threads[thread_id]) for _, _, thread_id in found]
+        return self._top[:k]
+
+    def observe(self, deals, timestamp=None):
+        """
+        Feed one scrape's deals, evict inactive threads and return the
+        top-K. Thread ids new to the top-K are left in self.entered.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for deal in deals:
+            thread_id = deal.get('thread_id')
+            views = parse_count(deal.get('rating'))
+            if not thread_id or views is None:
+                continue
+            self.update(thread_id, views, parse_count(deal.get('votes')) or 0, timestamp)
+        self.evict(timestamp)
+        top = self.top()
+        current = [thread_id for thread_id, _ in top]
+        self.entered = [thread_id for thread_id in current if thread_id not in self._previous_top]
+        self._previous_top = set(current)
+        return top
+
+    def annotate(self, deals):
+        """Add 'views_per_hour' and 'trend_rank' to deals in the top-K, for the digest"""
+        ranks = {thread_id: (rank, trend) for rank, (thread_id, trend) in enumerate(self.top(), 1)}
+        for deal in deals:
+            ranked = ranks.get(deal.get('thread_id'))
+            if ranked:
+                deal['trend_rank'] = ranked[0]
+                deal['views_per_hour'] = ranked[1].views_per_hour
+        return deals
+
+    @classmethod
+    def load(cls, conn, **kwargs):
+        """Restore ring buffers saved by save(), e.g. at the start of a task run"""
+        conn.executescript(SCHEMA)
+        tracker = cls(**kwargs)
+        rows = conn.execute('SELECT thread_id, samples FROM deal_trends ORDER BY last_seen').fetchall()
+        for thread_id, samples in rows:
+            for timestamp, views, votes in json.loads(samples)[-tracker.window:]:
+                tracker.update(thread_id, views, votes, timestamp)
+        tracker._dirty.clear()
+        tracker._previous_top = {thread_id for thread_id, _ in tracker.top()}
+        return tracker
+
+    def save(self, conn):
+        """Write changed ring buffers and the current top-K to the database"""
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO deal_trends (thread_id, samples, last_seen) VALUES (?, ?, ?)',
+                [(thread_id, json.dumps(list(self.threads[thread_id].samples)), self.threads[thread_id].last_seen)
+                 for thread_id in self._dirty],
+            )
+            conn.executemany('DELETE FROM deal_trends WHERE thread_id = ?', [(t,) for t in self._evicted])
+            conn.execute('DELETE FROM trending')
+            now = time.time()
+            conn.executemany(
+                'INSERT INTO trending (rank, thread_id, views, votes, views_per_hour, votes_per_hour, '
+                'acceleration, score, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(rank, thread_id, *trend.samples[-1][1:], trend.views_per_hour, trend.votes_per_hour,
+                  trend.acceleration, trend.score, now)
+                 for rank, (thread_id, trend) in enumerate(self.top(), 1)],
+            )
+        self._dirty.clear()
+        self._evicted.clear()
+
+
+def observe_scrape(deals, db_path=DEALS_DB_PATH, conn=None):
+    """
+    Load the saved trends, feed one scrape and save them back, for send
+    paths without a warm tracker. Returns the tracker so the caller can
+    annotate() the deals it puts in the digest.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path)
+    try:
+        tracker = TrendTracker.load(conn)
+        tracker.observe(deals)
+        tracker.save(conn)
+    finally:
+        if own_conn:
+            conn.close()
+    return tracker
+
+def top_rising(limit=TREND_TOP_K, db_path=DEALS_DB_PATH, conn=None):
+    """The top-K saved by the scraping task, joined with the deal archive"""
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path)
+    try:
+        conn.executescript(SCHEMA)
+        rows = conn.execute('''
+            SELECT t.rank, t.thread_id, d.title, d.url, t.views, t.votes, t.views_per_hour,
+                   t.votes_per_hour, t.acceleration, t.updated_at
+            FROM trending t
+            LEFT JOIN deals d ON d.thread_id = t.thread_id
+            ORDER BY t.rank
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    keys = ('rank', 'thread_id', 'title', 'url', 'views', 'votes', 'views_per_hour',
+            'votes_per_hour', 'acceleration', 'updated_at')
+    return [dict(zip(keys, row)) for row in rows]
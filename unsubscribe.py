@@ -0,0 +1,208 @@
+"""
+Stateless signed unsubscribe/resubscribe links.
+
+A token is the recipient's email plus an HMAC-SHA256 tag over the action
+and the email, so it can be checked without a database lookup and can't
+be forged or reused for another action. Tokens are generated in bulk at
+send time; the keyed HMAC state is computed once and copied per
+recipient, which keeps a 100k-recipient run well under a second.
+
+Unsubscribes are not written one by one. UnsubscribeBatcher collects them
+and applies them in one transaction per batch, either when the batch is
+full or shortly after the first pending request. Each request keeps the
+time it was made, and the write skips any subscriber whose reactivated_at
+is later, so a resubscribe handled meanwhile by another worker process is
+never undone by a batch flushed after it.
+"""
+
+import atexit
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from email import quoprimime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'subscribers.db')
+# Public address of the web app, e.g. https://deals.example.com. Per-recipient
+# unsubscribe links are only added to digests when this is set.
+PUBLIC_BASE_URL = (os.getenv('PUBLIC_BASE_URL') or '').rstrip('/')
+UNSUBSCRIBE_SECRET = os.getenv('UNSUBSCRIBE_SECRET') or os.getenv('FLASK_SECRET_KEY') or ''
+UNSUBSCRIBE_BATCH_SIZE = int(os.getenv('UNSUBSCRIBE_BATCH_SIZE', 500))
+UNSUBSCRIBE_FLUSH_SECONDS = float(os.getenv('UNSUBSCRIBE_FLUSH_SECONDS', 2.0))
+
+TAG_BYTES = 16
+
+# Marker lines left in the digest by message_builder and replaced per recipient
+HTML_PLACEHOLDER = b'@@UNSUBSCRIBE_HTML@@'
+TEXT_PLACEHOLDER = b'@@UNSUBSCRIBE_TEXT@@'
+UNSUBSCRIBE_LINK_STYLE = 'font-size:12px;color:#666'
+
+_base_mac = hmac.new(UNSUBSCRIBE_SECRET.encode('utf-8'), digestmod=hashlib.sha256)
+
+
+def links_enabled():
+    return bool(PUBLIC_BASE_URL and UNSUBSCRIBE_SECRET)
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _tag(action, email_bytes):
+    mac = _base_mac.copy()
+    mac.update(action.encode('ascii') + b':' + email_bytes)
+    return mac.digest()[:TAG_BYTES]
+
+def make_token(email, action='unsubscribe'):
+    # With an empty key anyone could mint the same tag, so refuse to sign
+    if not UNSUBSCRIBE_SECRET:
+        raise RuntimeError('UNSUBSCRIBE_SECRET (or FLASK_SECRET_KEY) must be set to sign unsubscribe links')
+    email_bytes = email.encode('utf-8')
+    return f"{_b64(email_bytes)}.{_b64(_tag(action, email_bytes))}"
+
+def make_tokens(emails, action='unsubscribe'):
+    """Tokens for many recipients at once"""
+    return [make_token(email, action) for email in emails]
+
+def verify_token(token, action='unsubscribe'):
+    """Email address the token was issued for, or None if it is invalid"""
+    # Fail closed: tokens signed with an empty key are forgeable
+    if not UNSUBSCRIBE_SECRET:
+        return None
+    try:
+        email_part, tag_part = token.split('.', 1)
+        email_bytes = _unb64(email_part)
+        tag = _unb64(tag_part)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(tag, _tag(action, email_bytes)):
+        return None
+    try:
+        return email_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+def unsubscribe_url(token):
+    return f"{PUBLIC_BASE_URL}/u/{token}"
+
+def _qp_line(text):
+    """
+    Quoted-printable encode one line. Links are printable ASCII where only
+    '=' needs escaping, so this skips email.quoprimime's per-character loop
+    and just adds soft line breaks; anything else falls back to it.
+    """
+    if not (text.isascii() and text.isprintable()) or text.endswith(' '):
+        return quoprimime.body_encode(text, eol='\r\n')
+    encoded = text.replace('=', '=3D')
+    lines = []
+    while len(encoded) > 76:
+        cut = 75
+        # Don't split an =3D escape across the soft break
+        if encoded[cut - 1] == '=':
+            cut -= 1
+        elif encoded[cut - 2] == '=':
+            cut -= 2
+        lines.append(encoded[:cut] + '=')
+        encoded = encoded[cut:]
+    lines.append(encoded)
+    return '\r\n'.join(lines)
+
+def split_message(message):
+    """
+    Cut pre-rendered digest bytes around the placeholders once, so each
+    recipient's copy is a single join instead of repeated replaces. The
+    real placeholders close their parts, so the split is from the right.
+    """
+    rest, tail = message.rsplit(HTML_PLACEHOLDER, 1)
+    head, middle = rest.rsplit(TEXT_PLACEHOLDER, 1)
+    return head, middle, tail
+
+def personalise_message(parts, token):
+    """
+    Add one recipient's unsubscribe link and List-Unsubscribe headers to a
+    digest split by split_message()
+    """
+    url = unsubscribe_url(token)
+    html_link = _qp_line(f'<a href="{url}" style="{UNSUBSCRIBE_LINK_STYLE}">Unsubscribe</a>').encode('ascii')
+    text_link = _qp_line(f"Unsubscribe: {url}").encode('ascii')
+    headers = (
+        f"List-Unsubscribe: <{url}>\r\n"
+        "List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n"
+    ).encode('ascii')
+    head, middle, tail = parts
+    return b''.join((headers, head, text_link, middle, html_link, tail))
+
+
+class UnsubscribeBatcher:
+    """Coalesces unsubscribe requests into batched UPDATEs"""
+
+    def __init__(self, db_path=DB_PATH, batch_size=UNSUBSCRIBE_BATCH_SIZE, flush_seconds=UNSUBSCRIBE_FLUSH_SECONDS):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # email -> time the unsubscribe was requested
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.timer = None
+        atexit.register(self.flush)
+
+    def _schedule(self):
+        # Caller holds self.lock
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_seconds, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def add(self, email):
+        """Queue an unsubscribe; never blocks on the database"""
+        requested_at = time.time()
+        with self.lock:
+            self.pending[email] = requested_at
+            full = len(self.pending) >= self.batch_size
+            if not full:
+                self._schedule()
+        if full:
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def discard(self, email):
+        """Drop a pending unsubscribe, e.g. when the address resubscribes first"""
+        with self.lock:
+            self.pending.pop(email, None)
+
+    def flush(self):
+        with self.lock:
+            requests, self.pending = list(self.pending.items()), {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not requests:
+            return 0
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                conn.executemany(
+                    'UPDATE subscribers SET is_active = 0 '
+                    'WHERE email = ? AND (reactivated_at IS NULL OR reactivated_at < ?)',
+                    requests,
+                )
+        except sqlite3.Error as e:
+            print(f"Error applying unsubscribes, will retry: {e}")
+            with self.lock:
+                for email, requested_at in requests:
+                    # A newer request for the same address may have arrived meanwhile
+                    if self.pending.get(email, 0) < requested_at:
+                        self.pending[email] = requested_at
+                self._schedule()
+            return 0
+        finally:
+            conn.close()
+        return len(requests)